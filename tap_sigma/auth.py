@@ -1,5 +1,6 @@
 """Authentication handler for Sigma Computing API."""
 
+import threading
 import time
 from typing import Any, Dict, Optional
 
@@ -16,6 +17,7 @@ class SigmaAuthenticator(OAuthAuthenticator):
         stream: RESTStreamBase,
         auth_endpoint: str,
         oauth_scopes: Optional[str] = None,
+        credentials: Optional[Dict[str, Any]] = None,
     ) -> None:
         """Initialize authenticator.
 
@@ -23,10 +25,14 @@ class SigmaAuthenticator(OAuthAuthenticator):
             stream: The stream instance to authenticate for.
             auth_endpoint: The OAuth endpoint for token requests.
             oauth_scopes: Optional OAuth scopes.
+            credentials: Settings with `client_id` and `client_secret` to use
+                instead of the tap config, e.g. for one of several organizations.
         """
         super().__init__(stream=stream, auth_endpoint=auth_endpoint)
         self._tap = stream._tap
+        self._credentials = credentials
         self._token_expires_at: Optional[float] = None
+        self._refresh_lock = threading.Lock()
 
     @property
     def oauth_request_body(self) -> Dict[str, Any]:
@@ -35,10 +41,11 @@ class SigmaAuthenticator(OAuthAuthenticator):
         Returns:
             Dictionary with OAuth request body.
         """
+        credentials = self._credentials or self.config
         return {
             "grant_type": "client_credentials",
-            "client_id": self.config.get("client_id"),
-            "client_secret": self.config.get("client_secret"),
+            "client_id": credentials.get("client_id"),
+            "client_secret": credentials.get("client_secret"),
         }
 
     def update_access_token(self) -> None:
@@ -127,9 +134,11 @@ class SigmaAuthenticator(OAuthAuthenticator):
         Returns:
             The authenticated request.
         """
-        # Refresh token if needed
+        # Refresh token if needed, once, even when requests run concurrently
         if not self.is_token_valid:
-            self.update_access_token()
+            with self._refresh_lock:
+                if not self.is_token_valid:
+                    self.update_access_token()
 
         # Add bearer token to request
         request.headers["Authorization"] = f"Bearer {self.access_token}"
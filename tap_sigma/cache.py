@@ -0,0 +1,299 @@
+"""Local cache of parent stream contexts for Sigma Computing child streams."""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Executor
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Child contexts written or read per database round trip
+BATCH_SIZE = 500
+
+
+class CachedContexts(NamedTuple):
+    """Child contexts cached for one parent listing."""
+
+    contexts: Iterator[Dict]
+    count: int
+    fetched_at: float
+    is_stale: bool
+
+
+class ListingWriter:
+    """Writes the child contexts of one parent listing as they are listed.
+
+    Rows are written in batches under a generation of their own and only
+    replace the cached listing on `commit`, so an interrupted listing leaves
+    the previous one in place. Use as a context manager: rows of a listing
+    that was not committed are discarded on exit.
+    """
+
+    def __init__(self, cache: "ParentContextCache", stream: str, parent_key: str):
+        """Initialize writer.
+
+        Args:
+            cache: Cache the listing is written to.
+            stream: Parent stream name.
+            parent_key: Key of the parent listing.
+        """
+        self._cache = cache
+        self._stream = stream
+        self._parent_key = parent_key
+        self._generation = uuid.uuid4().hex
+        self._batch: List[Tuple[str, str, str, int, str]] = []
+        self._count = 0
+        self._committed = False
+
+    def __enter__(self) -> "ListingWriter":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        if not self._committed:
+            self._batch = []
+            self._cache._delete_generation(
+                self._stream, self._parent_key, self._generation
+            )
+
+    def add(self, context: Dict) -> None:
+        """Append a child context to the listing.
+
+        Args:
+            context: Child context produced by the listing.
+        """
+        self._batch.append(
+            (
+                self._stream,
+                self._parent_key,
+                self._generation,
+                self._count,
+                json.dumps(context, separators=(",", ":")),
+            )
+        )
+        self._count += 1
+        if len(self._batch) >= BATCH_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        self._cache._insert_rows(self._batch)
+        self._batch = []
+
+    def commit(self) -> None:
+        """Make the complete listing the cached one for its parent key."""
+        self._flush()
+        self._cache._commit_listing(
+            self._stream, self._parent_key, self._generation, self._count
+        )
+        self._committed = True
+
+
+class ParentContextCache:
+    """SQLite-backed cache of the child contexts produced by parent streams.
+
+    Every child context of a parent listing (e.g. every ``workbookId``, or
+    every ``(workbookId, pageId)`` pair of one workbook) is stored as a row of
+    its own. Listings are written and read back in batches of `BATCH_SIZE`, so
+    a listing is never held in memory as a whole, however many parents it has.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int = 86400) -> None:
+        """Initialize cache.
+
+        Args:
+            path: SQLite database file path.
+            ttl_seconds: Age after which cached listings are considered stale.
+        """
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS parent_listings ("
+            "stream TEXT NOT NULL, "
+            "parent_key TEXT NOT NULL, "
+            "generation TEXT NOT NULL, "
+            "count INTEGER NOT NULL, "
+            "fetched_at REAL NOT NULL, "
+            "PRIMARY KEY (stream, parent_key))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS parent_listing_contexts ("
+            "stream TEXT NOT NULL, "
+            "parent_key TEXT NOT NULL, "
+            "generation TEXT NOT NULL, "
+            "position INTEGER NOT NULL, "
+            "context TEXT NOT NULL, "
+            "PRIMARY KEY (stream, parent_key, generation, position))"
+        )
+        self._conn.commit()
+        self._superseded: List[Tuple[str, str, str]] = []
+        self._refreshing: set = set()
+
+    @staticmethod
+    def _parent_key(context: Optional[Dict]) -> str:
+        return json.dumps(context or {}, sort_keys=True)
+
+    def get(self, stream: str, context: Optional[Dict]) -> Optional[CachedContexts]:
+        """Return cached child contexts for a parent listing.
+
+        Args:
+            stream: Parent stream name.
+            context: Context the parent stream was synced with.
+
+        Returns:
+            Cached contexts, read lazily, or None if the listing was never cached.
+        """
+        parent_key = self._parent_key(context)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT generation, count, fetched_at FROM parent_listings "
+                "WHERE stream = ? AND parent_key = ?",
+                (stream, parent_key),
+            ).fetchone()
+        if row is None:
+            return None
+
+        generation, count, fetched_at = row
+        return CachedContexts(
+            contexts=self._read_contexts(stream, parent_key, generation),
+            count=count,
+            fetched_at=fetched_at,
+            is_stale=time.time() - fetched_at > self.ttl_seconds,
+        )
+
+    def _read_contexts(
+        self, stream: str, parent_key: str, generation: str
+    ) -> Iterator[Dict]:
+        # Superseded generations are only deleted when the cache is closed, so
+        # a listing refreshed while it is being served is still read to the end
+        position = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT position, context FROM parent_listing_contexts "
+                    "WHERE stream = ? AND parent_key = ? AND generation = ? "
+                    "AND position > ? ORDER BY position LIMIT ?",
+                    (stream, parent_key, generation, position, BATCH_SIZE),
+                ).fetchall()
+            for position, context in rows:
+                yield json.loads(context)
+            if len(rows) < BATCH_SIZE:
+                return
+
+    def write_listing(self, stream: str, context: Optional[Dict]) -> ListingWriter:
+        """Start writing a parent listing.
+
+        Args:
+            stream: Parent stream name.
+            context: Context the parent stream is synced with.
+
+        Returns:
+            A writer whose `commit` replaces the cached listing.
+        """
+        return ListingWriter(self, stream, self._parent_key(context))
+
+    def put(
+        self, stream: str, context: Optional[Dict], contexts: Iterable[Dict]
+    ) -> None:
+        """Store the child contexts of a complete parent listing.
+
+        Args:
+            stream: Parent stream name.
+            context: Context the parent stream was synced with.
+            contexts: Child contexts produced by the listing.
+        """
+        with self.write_listing(stream, context) as listing:
+            for child_context in contexts:
+                listing.add(child_context)
+            listing.commit()
+
+    def _insert_rows(self, rows: List[Tuple[str, str, str, int, str]]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO parent_listing_contexts "
+                "(stream, parent_key, generation, position, context) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def _commit_listing(
+        self, stream: str, parent_key: str, generation: str, count: int
+    ) -> None:
+        with self._lock:
+            previous = self._conn.execute(
+                "SELECT generation FROM parent_listings "
+                "WHERE stream = ? AND parent_key = ?",
+                (stream, parent_key),
+            ).fetchone()
+            if previous is not None:
+                self._superseded.append((stream, parent_key, previous[0]))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parent_listings "
+                "(stream, parent_key, generation, count, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (stream, parent_key, generation, count, time.time()),
+            )
+            self._conn.commit()
+
+    def _delete_generation(self, stream: str, parent_key: str, generation: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM parent_listing_contexts "
+                "WHERE stream = ? AND parent_key = ? AND generation = ?",
+                (stream, parent_key, generation),
+            )
+            self._conn.commit()
+
+    def refresh_in_background(
+        self,
+        stream: str,
+        context: Optional[Dict],
+        list_contexts: Callable[[], Iterable[Dict]],
+        executor: Executor,
+    ) -> None:
+        """Re-list a stale parent listing without blocking the sync.
+
+        Stale listings are refreshed concurrently on the given executor; a
+        refresh already pending for the same listing is not queued again.
+
+        Args:
+            stream: Parent stream name.
+            context: Context the parent stream was synced with.
+            list_contexts: Callable performing the live listing.
+            executor: Executor running the refresh.
+        """
+        key = (stream, self._parent_key(context))
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh() -> None:
+            try:
+                self.put(stream, context, list_contexts())
+            except Exception as exc:
+                logger.warning(
+                    "Background refresh of cached '%s' contexts failed: %s",
+                    stream,
+                    exc,
+                )
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        executor.submit(refresh)
+
+    def close(self) -> None:
+        """Delete superseded listings and close the database.
+
+        Background refreshes run on an executor owned by the caller, which
+        must be shut down before the cache is closed.
+        """
+        for stream, parent_key, generation in self._superseded:
+            self._delete_generation(stream, parent_key, generation)
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,175 @@
+"""HTTP record/replay of Sigma Computing API traffic."""
+
+import gzip
+import io
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import timedelta
+from typing import IO, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+
+# Headers that may carry credentials and are never written to a cassette
+SCRUBBED_HEADERS = {"authorization", "cookie", "set-cookie", "x-api-key"}
+
+REDACTED = "<redacted>"
+
+
+def _open(path: str, mode: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class Cassette:
+    """Record API responses to, or replay them from, a JSON-lines cassette.
+
+    Each line holds one exchange: method, URL path, the stream's path
+    template, query parameters, status, headers, body and elapsed time.
+    Cassettes whose name ends in ``.gz`` are gzip-compressed.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        mode: str,
+        secrets: Iterable[str] = (),
+        replay_speed: float = 0,
+    ) -> None:
+        """Initialize cassette.
+
+        Args:
+            path: Cassette file path.
+            mode: Either "record" or "replay".
+            secrets: Values to redact from recorded URLs and bodies.
+            replay_speed: Replay timing relative to the recording (1 replays at
+                the original pace, 2 twice as fast); 0 replays without delays.
+
+        Raises:
+            ValueError: If the mode is unknown.
+        """
+        if mode not in ("record", "replay"):
+            msg = f"Unknown cassette mode: {mode}"
+            raise ValueError(msg)
+
+        self.path = path
+        self.mode = mode
+        self.replay_speed = replay_speed
+        self._secrets = [secret for secret in secrets if secret]
+        self._lock = threading.Lock()
+        self._file: Optional[IO[str]] = None
+        self._exchanges: Dict[Tuple[str, str, str], deque] = defaultdict(deque)
+
+        if mode == "record":
+            self._file = _open(path, "wt")
+        else:
+            with _open(path, "rt") as cassette_file:
+                for line in cassette_file:
+                    if line.strip():
+                        exchange = json.loads(line)
+                        key = (
+                            exchange["method"],
+                            exchange["path"],
+                            self._params_key(exchange["params"]),
+                        )
+                        self._exchanges[key].append(exchange)
+
+    @property
+    def replaying(self) -> bool:
+        """Return whether responses are served from the cassette."""
+        return self.mode == "replay"
+
+    @staticmethod
+    def _params_key(params: List[List[str]]) -> str:
+        return json.dumps(sorted(params))
+
+    def _scrub(self, text: str) -> str:
+        for secret in self._secrets:
+            text = text.replace(secret, REDACTED)
+        return text
+
+    def record(
+        self,
+        template: str,
+        request: requests.PreparedRequest,
+        response: requests.Response,
+    ) -> None:
+        """Append an exchange to the cassette.
+
+        Args:
+            template: Path template of the stream that sent the request.
+            request: The request that was sent.
+            response: The response received.
+        """
+        url = urlsplit(request.url)
+        exchange = {
+            "method": request.method,
+            "path": self._scrub(url.path),
+            "template": template,
+            "params": [
+                [key, self._scrub(value)] for key, value in parse_qsl(url.query)
+            ],
+            "status": response.status_code,
+            "headers": {
+                key: value
+                for key, value in response.headers.items()
+                if key.lower() not in SCRUBBED_HEADERS
+            },
+            "body": self._scrub(response.text),
+            "elapsed": response.elapsed.total_seconds(),
+        }
+        line = json.dumps(exchange, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+        # Reading the body above drained a streamed response
+        response.raw = io.BytesIO(response.content)
+
+    def play(self, request: requests.PreparedRequest) -> requests.Response:
+        """Return the recorded response for a request.
+
+        Repeated requests are answered in recording order; once exhausted, the
+        last recorded response is served again.
+
+        Args:
+            request: The request to answer.
+
+        Returns:
+            The recorded response.
+
+        Raises:
+            LookupError: If the cassette has no exchange for the request.
+        """
+        url = urlsplit(request.url)
+        key = (request.method, url.path, self._params_key(parse_qsl(url.query)))
+        with self._lock:
+            exchanges = self._exchanges.get(key)
+            if not exchanges:
+                msg = f"No recorded response for {request.method} {request.url}"
+                raise LookupError(msg)
+            exchange = exchanges.popleft() if len(exchanges) > 1 else exchanges[0]
+
+        if self.replay_speed:
+            time.sleep(exchange["elapsed"] / self.replay_speed)
+
+        response = requests.Response()
+        response.status_code = exchange["status"]
+        response.headers.update(exchange["headers"])
+        for header in ("Content-Encoding", "Content-Length", "Transfer-Encoding"):
+            response.headers.pop(header, None)
+        response._content = exchange["body"].encode("utf-8")
+        response.raw = io.BytesIO(response._content)
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=exchange["elapsed"])
+        return response
+
+    def close(self) -> None:
+        """Flush and close a cassette being recorded."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
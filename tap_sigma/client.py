@@ -1,14 +1,172 @@
 """REST client handling for Sigma Computing API streams."""
 
-from typing import Any, Dict, Optional, Iterable
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 from urllib.parse import urljoin
 
 import requests
+from singer_sdk import metrics
+from singer_sdk import typing as th
+from singer_sdk._singerlib import RecordMessage
+from singer_sdk._singerlib.messages import format_message
+from singer_sdk.authenticators import APIAuthenticatorBase, SimpleAuthenticator
+from singer_sdk.exceptions import RetriableAPIError
+from singer_sdk.helpers._typing import TypeConformanceLevel, conform_record_data_types
+from singer_sdk.helpers._util import utc_now
 from singer_sdk.helpers.jsonpath import extract_jsonpath
 from singer_sdk.pagination import BaseAPIPaginator
 from singer_sdk.streams import RESTStream
 
 from tap_sigma.auth import SigmaAuthenticator
+from tap_sigma.lineage import (
+    LINEAGE_LISTING_STREAMS,
+    LINEAGE_SOURCE_STREAMS,
+    Edge,
+    record_edges,
+)
+
+# Stream state key of parents known to have no records for an endpoint
+NEGATIVE_CACHE_KEY = "negative_cache"
+
+# Number of records requested per page
+PAGE_SIZE = 100
+
+# Stream state key of the contexts completed by a run that stopped early
+COMPLETED_CONTEXTS_KEY = "completed_contexts"
+
+# Requests timed per stream before slow ones are hedged at the observed p95
+HEDGE_MIN_SAMPLES = 20
+
+# Placeholder record key holding a RECORD message serialized by a worker
+SERIALIZED_MESSAGE_KEY = "__serialized_record_message__"
+
+
+class BudgetExhaustedError(Exception):
+    """Raised instead of sending a request once the run's budget is spent."""
+
+
+def stable_hash(context: Dict) -> int:
+    """Return a hash of a context that is identical across processes and runs.
+
+    Args:
+        context: Context dictionary to hash.
+
+    Returns:
+        Non-negative integer hash.
+    """
+    key = json.dumps(context, sort_keys=True, separators=(",", ":"))
+    return int(hashlib.sha1(key.encode()).hexdigest()[:16], 16)
+
+
+def extract_records(data: Any) -> List[dict]:
+    """Return the records of a decoded API response.
+
+    Args:
+        data: Decoded JSON response body.
+
+    Returns:
+        Record dictionaries.
+    """
+    # Handle different response formats
+    if isinstance(data, dict):
+        # Check for 'entries' key (common in Sigma API)
+        if "entries" in data:
+            return data["entries"]
+        # Check for other common list keys
+        for key in ["data", "results", "items"]:
+            if key in data:
+                return data[key]
+        # Single object response
+        return [data]
+    if isinstance(data, list):
+        # Direct list response
+        return data
+    return []
+
+
+def page_record_count(data: Any) -> Optional[int]:
+    """Return the number of records that decides whether a page is the last.
+
+    Args:
+        data: Decoded JSON response body.
+
+    Returns:
+        The number of `entries` of an object response or of items of a list
+        response, or None for any other response, which is always the last.
+    """
+    if isinstance(data, dict):
+        # For responses with 'entries' key
+        return len(data.get("entries", []))
+    if isinstance(data, list):
+        # For direct list responses
+        return len(data)
+    return None
+
+
+def parse_page(
+    content: bytes,
+    stream_name: str,
+    schema: dict,
+    deselected_properties: List[str],
+    context: Optional[Dict],
+    conformance_level: TypeConformanceLevel,
+) -> Tuple[Optional[int], List[str]]:
+    """Parse one response page into serialized RECORD messages.
+
+    Runs in a worker process: decodes the page, adds the context keys the
+    stream's schema declares (as the streams' `post_process` does), removes
+    deselected properties, conforms the records to the schema and
+    serializes them.
+
+    Args:
+        content: Raw response body.
+        stream_name: Name of the stream the page belongs to.
+        schema: Stream schema.
+        deselected_properties: Properties deselected in the catalog.
+        context: Stream partition or context dictionary.
+        conformance_level: Type conformance level of the stream.
+
+    Returns:
+        The page's record count, as `page_record_count` counts it to end
+        pagination, and its serialized messages.
+    """
+    data = json.loads(content)
+    records = extract_records(data)
+    context_values = {
+        key: value
+        for key, value in (context or {}).items()
+        if key in schema.get("properties", {})
+    }
+    messages = []
+    for record in records:
+        record.update(context_values)
+        for key in deselected_properties:
+            record.pop(key, None)
+        record = conform_record_data_types(
+            stream_name=stream_name,
+            record=record,
+            schema=schema,
+            level=conformance_level,
+            logger=logging.getLogger(stream_name),
+        )
+        messages.append(
+            format_message(
+                RecordMessage(stream=stream_name, record=record, time_extracted=utc_now())
+            )
+        )
+    return page_record_count(data), messages
+
+
+def _close_response(future: Future) -> None:
+    """Close the response of a request that lost a hedging race."""
+    if future.exception() is None:
+        future.result().close()
 
 
 class SigmaPaginator(BaseAPIPaginator):
@@ -37,25 +195,25 @@ class SigmaPaginator(BaseAPIPaginator):
         if self._finished:
             return False
 
-        data = response.json()
+        return self.has_more_records(page_record_count(response.json()))
+
+    def has_more_records(self, record_count: Optional[int]) -> bool:
+        """Check if more pages exist after a page with a number of records.
+
+        Args:
+            record_count: Records on the page, as counted by `page_record_count`.
+
+        Returns:
+            True if the page was full, so more pages may exist.
+        """
+        if self._finished:
+            return False
 
         # Check if we got a full page of results
-        if isinstance(data, dict):
-            # For responses with 'entries' key
-            entries = data.get("entries", [])
-            if len(entries) < self._page_size:
-                self._finished = True
-                return False
-            return True
-        elif isinstance(data, list):
-            # For direct list responses
-            if len(data) < self._page_size:
-                self._finished = True
-                return False
-            return True
-
-        self._finished = True
-        return False
+        if record_count is None or record_count < self._page_size:
+            self._finished = True
+            return False
+        return True
 
     def get_next(self, response: requests.Response) -> Optional[int]:
         """Get next page offset.
@@ -76,6 +234,173 @@ class SigmaStream(RESTStream):
     """Base stream class for Sigma Computing API."""
 
     _shared_authenticator: Optional[SigmaAuthenticator] = None
+    _org_authenticators: Dict[str, SigmaAuthenticator] = {}
+
+    # Child streams setting this are fetched concurrently, a batch of parent
+    # records ahead, instead of one parent at a time.
+    prefetch_from_parent = False
+
+    # Names of top-level streams that must be synced before this one
+    sync_after: Tuple[str, ...] = ()
+
+    # Status codes meaning "this parent has none": no records, no error
+    empty_response_codes: Tuple[int, ...] = ()
+
+    # Whether pages may be parsed in the process pool; streams whose
+    # post_process does more than add context keys must disable this
+    offload_parsing = True
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        """Initialize stream."""
+        super().__init__(*args, **kwargs)
+        self._prefetched: Dict[str, Future] = {}
+        self._contexts_synced = 0
+        self._child_contexts_generated = 0
+        # Breaker state per organization (None without `organizations`)
+        self._consecutive_errors: Dict[Optional[str], int] = {}
+        self._open_circuits: set = set()
+        self._circuit_lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=200)
+        self._completed_contexts: set = set()
+        self._records_emitted = 0
+        self._resumed: Optional[set] = None
+        # Contexts whose listing was served from the parent cache this run
+        self._cached_listings: set = set()
+        self._latency_lock = threading.Lock()
+
+        if self._tap.organizations:
+            # Records of every organization carry the org they came from
+            self.schema = {
+                **self.schema,
+                "properties": {
+                    "orgId": th.StringType().to_dict(),
+                    **self.schema["properties"],
+                },
+            }
+            self.primary_keys = ["orgId", *(self.primary_keys or [])]
+
+    @property
+    def partitions(self) -> Optional[List[Dict]]:
+        """Return one partition per organization for top-level streams.
+
+        Returns:
+            Partition contexts, or the partitions defined in state.
+        """
+        if self.parent_stream_type is None and self._tap.organizations:
+            return [{"orgId": org_id} for org_id in self._tap.organizations]
+        return super().partitions
+
+    def _organization(self, context: Optional[Dict]) -> Optional[Dict[str, Any]]:
+        """Return the organization settings a context belongs to.
+
+        Args:
+            context: Stream partition or context dictionary.
+
+        Returns:
+            The organization, or None for the single organization of the config.
+        """
+        org_id = (context or {}).get("orgId")
+        if org_id is None:
+            return None
+        return self._tap.organizations[org_id]
+
+    def get_url(self, context: Optional[Dict]) -> str:
+        """Return the URL for a context, on its organization's API host.
+
+        Args:
+            context: Stream partition or context dictionary.
+
+        Returns:
+            The request URL.
+        """
+        url = super().get_url(context)
+        organization = self._organization(context)
+        if organization is not None:
+            url = organization["api_url"].rstrip("/") + url[len(self.url_base):]
+        return url
+
+    def _session(self, context: Optional[Dict]) -> requests.Session:
+        """Return the HTTP session (connection pool) for a context's organization.
+
+        Args:
+            context: Stream partition or context dictionary.
+
+        Returns:
+            The session to send requests with.
+        """
+        organization = self._organization(context)
+        if organization is None:
+            return self.requests_session
+        return self._tap.org_session(organization["org_id"])
+
+    def _org_authenticator(self, organization: Dict[str, Any]) -> SigmaAuthenticator:
+        """Return the shared authenticator of an organization.
+
+        Args:
+            organization: Organization settings.
+
+        Returns:
+            The organization's authenticator.
+        """
+        org_id = organization["org_id"]
+        if org_id not in SigmaStream._org_authenticators:
+            auth_endpoint = urljoin(organization["api_url"], "/v2/auth/token")
+            SigmaStream._org_authenticators[org_id] = SigmaAuthenticator(
+                stream=self, auth_endpoint=auth_endpoint, credentials=organization
+            )
+        return SigmaStream._org_authenticators[org_id]
+
+    def build_request(
+        self, context: Optional[Dict], **kwargs: Any
+    ) -> requests.PreparedRequest:
+        """Build an authenticated request for a context's organization.
+
+        Args:
+            context: Stream partition or context dictionary.
+            **kwargs: Keyword arguments to pass to :class:`requests.Request`.
+
+        Returns:
+            A :class:`requests.PreparedRequest` object.
+        """
+        organization = self._organization(context)
+        cassette = self._tap.cassette
+        if organization is None or (cassette is not None and cassette.replaying):
+            return self.build_prepared_request(**kwargs)
+
+        request = requests.Request(**kwargs, auth=self._org_authenticator(organization))
+        return self._session(context).prepare_request(request)
+
+    def prepare_request(
+        self,
+        context: Optional[Dict],
+        next_page_token: Optional[int],
+    ) -> requests.PreparedRequest:
+        """Prepare a request object for this stream.
+
+        Args:
+            context: Stream partition or context dictionary.
+            next_page_token: Pagination token.
+
+        Returns:
+            A request authenticated for the context's organization.
+        """
+        return self.build_request(
+            context,
+            method=self.rest_method,
+            url=self.get_url(context),
+            params=self.get_url_params(context, next_page_token),
+            headers=self.http_headers,
+            json=self.prepare_request_payload(context, next_page_token),
+        )
+
+    @property
+    def requests_session(self) -> requests.Session:
+        """Return the tap's HTTP session, shared by all streams.
+
+        Returns:
+            The :class:`requests.Session` object for HTTP requests.
+        """
+        return self._tap.http_session
 
     @property
     def url_base(self) -> str:
@@ -84,8 +409,13 @@ class SigmaStream(RESTStream):
         return api_url
 
     @property
-    def authenticator(self) -> SigmaAuthenticator:
+    def authenticator(self) -> APIAuthenticatorBase:
         """Return shared authenticator instance to avoid rate limiting."""
+        cassette = self._tap.cassette
+        if cassette is not None and cassette.replaying:
+            # Replayed responses need no token
+            return SimpleAuthenticator(stream=self)
+
         if SigmaStream._shared_authenticator is None:
             auth_endpoint = urljoin(self.url_base, "/v2/auth/token")
             SigmaStream._shared_authenticator = SigmaAuthenticator(
@@ -111,7 +441,7 @@ class SigmaStream(RESTStream):
         Returns:
             A new paginator.
         """
-        return SigmaPaginator(start_value=0, page_size=100)
+        return SigmaPaginator(start_value=0, page_size=PAGE_SIZE)
 
     def get_url_params(
         self,
@@ -132,10 +462,887 @@ class SigmaStream(RESTStream):
         # Add pagination parameters if supported
         if next_page_token is not None:
             params["offset"] = next_page_token
-            params["limit"] = 100
+            params["limit"] = PAGE_SIZE
 
         return params
 
+    def get_records(self, context: Optional[Dict]) -> Iterable[Dict[str, Any]]:
+        """Return records, stopping gracefully once the run's budget is spent.
+
+        Contexts completed by a previous run that stopped early are skipped,
+        and so is everything after the stream's `max_records_per_stream`.
+        Once `max_runtime_seconds` or `max_requests` is reached no new request
+        is sent: the context being synced ends where it is, and neither it nor
+        any context still open is marked complete, so the next run syncs them
+        again.
+
+        Args:
+            context: Stream partition or context dictionary.
+
+        Yields:
+            Record dictionaries.
+        """
+        key = stable_hash(context or {})
+        if key in self._resumed_contexts or self._record_cap_reached:
+            return
+        if self._tap.stop_reason is not None:
+            self._tap.sync_interrupted = True
+            return
+
+        self._contexts_synced += 1
+        lineage = None
+        if self.name in LINEAGE_SOURCE_STREAMS or self.name in LINEAGE_LISTING_STREAMS:
+            lineage = self._tap.lineage
+        id_field = LINEAGE_LISTING_STREAMS.get(self.name)
+        edges: List[Edge] = []
+        listed_ids: List[str] = []
+        try:
+            for record in self._get_context_records(context):
+                if lineage is not None:
+                    edges.extend(record_edges(self.name, record))
+                    if id_field is not None:
+                        listed_ids.append(record.get(id_field))
+                yield record
+                self._records_emitted += 1
+                if self._record_cap_reached:
+                    # Stop here, without requesting the remaining pages
+                    self.logger.info(f"Reached the record cap of '{self.name}'")
+                    self.cancel_prefetches()
+                    return
+        except BudgetExhaustedError:
+            self._tap.sync_interrupted = True
+            self.cancel_prefetches()
+            return
+        if not self._tap.sync_interrupted:
+            self._completed_contexts.add(key)
+            # Cached child contexts are not records, and may be out of date
+            if lineage is not None and key not in self._cached_listings:
+                lineage.update(
+                    self.name,
+                    context,
+                    edges,
+                    listed_ids if id_field is not None else None,
+                )
+
+    @property
+    def circuit_open(self) -> bool:
+        """Return whether the stream stopped requesting a failing endpoint.
+
+        Returns:
+            True once `circuit_breaker_threshold` consecutive requests to one
+            organization failed.
+        """
+        return bool(self._open_circuits)
+
+    @property
+    def _record_cap_reached(self) -> bool:
+        """Return whether the stream emitted `max_records_per_stream` records."""
+        cap = self.config.get("max_records_per_stream")
+        return bool(cap) and self._records_emitted >= cap
+
+    @property
+    def _resumed_contexts(self) -> set:
+        """Return the contexts completed by a previous run that stopped early."""
+        if self._resumed is None:
+            completed = self.stream_state.get(COMPLETED_CONTEXTS_KEY, [])
+            self._resumed = {int(key, 16) for key in completed}
+        return self._resumed
+
+    def prune_negative_cache(self) -> None:
+        """Drop expired negative-cache entries from the stream's state.
+
+        Entries are otherwise only replaced when their parent is visited
+        again, so those of deleted parents would stay in state for good.
+        """
+        ttl = self.config.get("negative_cache_ttl_seconds", 604800)
+        with self._tap.state_lock:
+            negative_cache = self.stream_state.get(NEGATIVE_CACHE_KEY)
+            if negative_cache is None:
+                return
+            now = time.time()
+            for cache_key, entry in list(negative_cache.items()):
+                if now - entry["cachedAt"] >= ttl:
+                    del negative_cache[cache_key]
+            if not negative_cache:
+                del self.stream_state[NEGATIVE_CACHE_KEY]
+
+    def record_resume_point(self) -> None:
+        """Store the contexts completed so far if the run stopped early.
+
+        After a complete run the resume point of a previous run is cleared.
+        """
+        if not self._tap.sync_interrupted:
+            self.stream_state.pop(COMPLETED_CONTEXTS_KEY, None)
+            return
+
+        completed = self._resumed_contexts | self._completed_contexts
+        if completed:
+            self.stream_state[COMPLETED_CONTEXTS_KEY] = sorted(
+                f"{key:016x}" for key in completed
+            )
+
+    def _get_context_records(
+        self, context: Optional[Dict], prefetching: bool = False
+    ) -> Iterable[Dict[str, Any]]:
+        """Return records, using prefetched results and the parent cache if enabled.
+
+        Records already fetched concurrently by the parent stream (see
+        `prefetch_from_parent`) are served from memory. Otherwise the stream
+        is listed. Either way, the children that support prefetching get their
+        requests started on the tap's worker pool a batch of parent records
+        ahead.
+
+        Args:
+            context: Stream partition or context dictionary.
+            prefetching: Whether the records are being prefetched, on a worker
+                thread; they are then listed, and their children are not
+                prefetched until the records are served.
+
+        Yields:
+            Record dictionaries.
+        """
+        future = None
+        if not prefetching:
+            future = self._prefetched.pop(self._context_key(context), None)
+        if future is not None and not future.cancelled():
+            records: Iterable[Dict[str, Any]] = future.result()
+        elif self.empty_response_codes:
+            records = self._get_optional_records(context)
+        else:
+            records = self._get_parent_records(context)
+        prefetch_children = [
+            child
+            for child in self.child_streams
+            if child.prefetch_from_parent
+            and (child.selected or child.has_selected_descendents)
+        ]
+        if prefetching or not prefetch_children:
+            yield from records
+            return
+
+        batch_size = self.config.get("max_workers", 8) * 4
+        batch: List[Dict] = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                self._prefetch_children(prefetch_children, batch, context)
+                yield from batch
+                batch = []
+        self._prefetch_children(prefetch_children, batch, context)
+        yield from batch
+
+    def _get_optional_records(
+        self, context: Optional[Dict]
+    ) -> Iterable[Dict[str, Any]]:
+        """Return records of an endpoint that many parents do not have.
+
+        Parents whose endpoint returned nothing (or one of
+        `empty_response_codes`) are remembered in the stream's state for
+        `negative_cache_ttl_seconds`, or until the parent's `updatedAt`
+        changes, and skipped meanwhile. Requests still failing with a
+        transient error (5xx, connection errors, timeouts) once retries are
+        exhausted are logged and skipped; after `circuit_breaker_threshold`
+        consecutive failures the endpoint is not requested again for the rest
+        of the run, from the organization that failed. Any other error,
+        authentication failures included, fails the sync.
+
+        Args:
+            context: Stream partition or context dictionary.
+
+        Yields:
+            Record dictionaries.
+        """
+        org_id = (context or {}).get("orgId")
+        if org_id in self._open_circuits:
+            return
+
+        cache_key = RESTStream.get_url(self, context)[len(self.url_base):]
+        if context and "orgId" in context:
+            cache_key = f"{context['orgId']}:{cache_key}"
+        parent_version = self._tap.parent_versions.get(self._context_key(context))
+        ttl = self.config.get("negative_cache_ttl_seconds", 604800)
+        with self._tap.state_lock:
+            negative_cache = self.stream_state.setdefault(NEGATIVE_CACHE_KEY, {})
+            entry = negative_cache.get(cache_key)
+            if entry is not None:
+                if time.time() - entry["cachedAt"] < ttl and (
+                    parent_version is None
+                    or entry.get("parentUpdatedAt") in (None, parent_version)
+                ):
+                    return
+                del negative_cache[cache_key]
+
+        record_count = 0
+        try:
+            for record in self._get_parent_records(context):
+                record_count += 1
+                yield record
+        except (
+            RetriableAPIError,
+            requests.ConnectionError,
+            requests.Timeout,
+        ) as ex:
+            self.logger.warning(f"Skipping '{self.name}' for {context}: {ex}")
+            threshold = self.config.get("circuit_breaker_threshold", 10)
+            with self._circuit_lock:
+                errors = self._consecutive_errors.get(org_id, 0) + 1
+                self._consecutive_errors[org_id] = errors
+                if not threshold or errors < threshold:
+                    return
+                self._open_circuits.add(org_id)
+            org = f" for organization '{org_id}'" if org_id else ""
+            self.logger.warning(
+                f"'{self.name}' failed {errors} times in a row{org}; not "
+                "requesting it again during this run"
+            )
+            return
+
+        with self._circuit_lock:
+            self._consecutive_errors[org_id] = 0
+        if record_count == 0 and ttl:
+            with self._tap.state_lock:
+                negative_cache[cache_key] = {
+                    "cachedAt": time.time(),
+                    "parentUpdatedAt": parent_version,
+                }
+
+    def _get_parent_records(self, context: Optional[Dict]) -> Iterable[Dict[str, Any]]:
+        """Return records, serving parent listings from the parent cache if enabled.
+
+        When this stream only runs to feed its child streams (it is not
+        selected itself) and a cached listing exists, the cached child contexts
+        are yielded in place of records so children can fan out directly.
+
+        Args:
+            context: Stream partition or context dictionary.
+
+        Yields:
+            Record dictionaries.
+        """
+        cache = self._tap.parent_cache if self.child_streams else None
+        if cache is None:
+            yield from super().get_records(context)
+            return
+
+        if not self.selected:
+            cached = cache.get(self.name, context)
+            if cached is not None:
+                if cached.is_stale and self._tap.stop_reason is None:
+                    cache.refresh_in_background(
+                        self.name,
+                        context,
+                        lambda: self._list_child_contexts(context),
+                        self._tap.worker_pool,
+                    )
+                self.logger.info(
+                    f"Serving {cached.count} cached child contexts for '{self.name}'"
+                )
+                self._cached_listings.add(stable_hash(context or {}))
+                yield from cached.contexts
+                return
+
+        # Child contexts are written as records are listed, and the listing is
+        # only cached once it is complete
+        with cache.write_listing(self.name, context) as listing:
+            for record in super().get_records(context):
+                listing.add(self._cached_child_context(record, context))
+                yield record
+            listing.commit()
+
+    def _cached_child_context(self, record: Dict, context: Optional[Dict]) -> Dict:
+        """Return the child context of a record as stored in the parent cache.
+
+        The record's `updatedAt` is stored alongside, so that children of a
+        parent served from the cache can still tell whether it changed (see
+        `_get_optional_records`).
+
+        Args:
+            record: Parent record.
+            context: Context the parent stream is synced with.
+
+        Returns:
+            The child context, with the parent's `updatedAt` if it has one.
+        """
+        child_context = self.get_child_context(record, context)
+        if record.get("updatedAt"):
+            child_context = {**child_context, "updatedAt": record["updatedAt"]}
+        return child_context
+
+    def _prefetch_children(
+        self,
+        children: List["SigmaStream"],
+        records: List[Dict],
+        context: Optional[Dict],
+    ) -> None:
+        """Start child requests for a batch of parent records on the worker pool.
+
+        Args:
+            children: Child streams that support prefetching.
+            records: Parent records whose children should be fetched.
+            context: Context the parent stream is synced with.
+        """
+        for record in records:
+            for child_context in self.generate_child_contexts(record, context):
+                if child_context is None:
+                    continue
+                for child in children:
+                    child.prefetch(child_context)
+
+    def prefetch(self, context: Dict) -> None:
+        """Start fetching this stream's records for a context in the background.
+
+        Args:
+            context: Context the stream will later be synced with.
+        """
+        self._prefetched[self._context_key(context)] = self._tap.worker_pool.submit(
+            self._prefetch_records, context
+        )
+
+    def _prefetch_records(self, context: Dict) -> List[Dict[str, Any]]:
+        """Fetch the records of a context on a worker thread.
+
+        The listing goes through `_get_context_records`, so an open circuit
+        breaker skips it, and it stops once the records fetched would reach
+        `max_records_per_stream`.
+
+        Args:
+            context: Context the stream will later be synced with.
+
+        Returns:
+            Record dictionaries.
+        """
+        records: List[Dict[str, Any]] = []
+        cap = self.config.get("max_records_per_stream")
+        if self._record_cap_reached:
+            return records
+        for record in self._get_context_records(context, prefetching=True):
+            records.append(record)
+            if cap and self._records_emitted + len(records) >= cap:
+                break
+        return records
+
+    def cancel_prefetches(self, org_id: Optional[str] = None) -> None:
+        """Cancel the prefetched listings that were not consumed.
+
+        Called when the stream stops early and when its stream tree finishes.
+
+        Args:
+            org_id: Only cancel the listings of this organization, if set.
+        """
+        for key in list(self._prefetched):
+            if org_id is None or json.loads(key).get("orgId") == org_id:
+                future = self._prefetched.pop(key, None)
+                if future is not None:
+                    future.cancel()
+
+    @staticmethod
+    def _context_key(context: Optional[Dict]) -> str:
+        return json.dumps(context or {}, sort_keys=True)
+
+    def generate_child_contexts(
+        self, record: dict, context: Optional[Dict]
+    ) -> Iterable[Optional[Dict]]:
+        """Generate child contexts, keeping only this process's shard of parents.
+
+        With `shard_count` > 1, contexts produced by top-level parent streams
+        are hash-partitioned so that each tap process syncs a disjoint slice
+        of the child streams. With `parent_sample_fraction` below 1, only a
+        hash-based sample of those contexts is kept.
+
+        Args:
+            record: Individual record in the stream.
+            context: Stream partition or context dictionary.
+
+        Yields:
+            Child contexts belonging to this shard.
+        """
+        shard_count = self.config.get("shard_count", 1)
+        for child_context in super().generate_child_contexts(record, context):
+            if child_context is not None and context and "orgId" in context:
+                child_context = {"orgId": context["orgId"], **child_context}
+            if (
+                shard_count > 1
+                and self.parent_stream_type is None
+                and child_context is not None
+                and stable_hash(child_context) % shard_count
+                != self.config.get("shard_index", 0)
+            ):
+                continue
+            if (
+                self.parent_stream_type is None
+                and child_context is not None
+                and not self._in_sample(child_context)
+            ):
+                continue
+            self._child_contexts_generated += 1
+            if record.get("updatedAt") and any(
+                child.empty_response_codes for child in self.child_streams
+            ):
+                self._tap.parent_versions[self._context_key(child_context)] = record[
+                    "updatedAt"
+                ]
+            yield child_context
+
+    def _in_sample(self, child_context: Dict) -> bool:
+        """Return whether a parent belongs to the `parent_sample_fraction` sample.
+
+        The high bits of the context's stable hash are used, so that samples
+        are reproducible and independent of the shard a parent belongs to.
+
+        Args:
+            child_context: Context produced by a top-level parent record.
+
+        Returns:
+            True if child streams should be synced for the parent.
+        """
+        fraction = self.config.get("parent_sample_fraction", 1)
+        return fraction >= 1 or stable_hash(child_context) / 2**64 < fraction
+
+    def _list_child_contexts(self, context: Optional[Dict]) -> Iterable[Dict]:
+        """List this stream live and yield the child contexts of its records.
+
+        Args:
+            context: Stream partition or context dictionary.
+
+        Yields:
+            Child contexts for every record.
+        """
+        for record in super().get_records(context):
+            yield self._cached_child_context(record, context)
+
+    def _request(
+        self,
+        prepared_request: requests.PreparedRequest,
+        context: Optional[Dict],
+        stream: bool = False,
+    ) -> requests.Response:
+        """Send a request, recording or replaying it when a cassette is configured.
+
+        Args:
+            prepared_request: The request to send.
+            context: Stream partition or context dictionary.
+            stream: Whether to leave the response body unread, for downloads.
+
+        Returns:
+            The validated response.
+
+        Raises:
+            BudgetExhaustedError: If the run's time or request budget is spent.
+        """
+        stop_reason = self._tap.stop_reason
+        if stop_reason is not None:
+            raise BudgetExhaustedError(stop_reason)
+        self._tap.count_request()
+
+        cassette = self._tap.cassette
+        if cassette is not None and cassette.replaying:
+            response = cassette.play(prepared_request)
+        else:
+            rate_limiter = self._tap.rate_limiter(context)
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            if (
+                prepared_request.method == "GET"
+                and not stream
+                and self.config.get("hedge_requests")
+            ):
+                response = self._send_hedged(prepared_request, context)
+            else:
+                response = self._send(prepared_request, context, stream=stream)
+            if cassette is not None:
+                cassette.record(self.path, prepared_request, response)
+
+        self._write_request_duration_log(
+            endpoint=self.path,
+            response=response,
+            context=context,
+            extra_tags={"url": prepared_request.path_url}
+            if self._LOG_REQUEST_METRIC_URLS
+            else None,
+        )
+        self.validate_response(response)
+        return response
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        """Return the connect and read timeouts of this stream's requests.
+
+        Streams listed in `request_timeouts` use their own values, others the
+        tap-wide `connect_timeout_seconds` and `read_timeout_seconds`.
+
+        Returns:
+            The (connect, read) timeouts in seconds.
+        """
+        connect = self.config.get("connect_timeout_seconds", 10)
+        read = self.config.get("read_timeout_seconds", 300)
+        for endpoint in self.config.get("request_timeouts") or []:
+            if endpoint["stream"] == self.name:
+                connect = endpoint.get("connect_seconds", connect)
+                read = endpoint.get("read_seconds", read)
+        return connect, read
+
+    def _send(
+        self,
+        prepared_request: requests.PreparedRequest,
+        context: Optional[Dict],
+        stream: bool = False,
+    ) -> requests.Response:
+        """Send a request and record its latency.
+
+        Args:
+            prepared_request: The request to send.
+            context: Stream partition or context dictionary.
+            stream: Whether to leave the response body unread.
+
+        Returns:
+            The response.
+        """
+        start = time.monotonic()
+        response = self._session(context).send(
+            prepared_request, timeout=self.timeout, stream=stream
+        )
+        with self._latency_lock:
+            self._latencies.append(time.monotonic() - start)
+        return response
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Return the observed p95 latency of this stream's requests.
+
+        Returns:
+            Seconds to wait before hedging, or None until enough requests
+            have been timed.
+        """
+        with self._latency_lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[int(len(latencies) * 0.95)]
+
+    def _send_hedged(
+        self, prepared_request: requests.PreparedRequest, context: Optional[Dict]
+    ) -> requests.Response:
+        """Send an idempotent request, duplicating it if it is slower than p95.
+
+        The duplicate is only sent while the run's hedge budget
+        (`max_hedged_requests`) and the org's rate budget allow it. Whichever
+        response arrives first is used; the other is closed when it arrives.
+
+        Args:
+            prepared_request: The GET request to send.
+            context: Stream partition or context dictionary.
+
+        Returns:
+            The first response received.
+        """
+        delay = self._hedge_delay()
+        if delay is None:
+            return self._send(prepared_request, context)
+
+        hedge_pool = self._tap.hedge_pool
+        futures = [hedge_pool.submit(self._send, prepared_request, context)]
+        done, _ = wait(futures, timeout=delay)
+        if not done and self._tap.take_hedge(context):
+            self.logger.info(
+                f"Hedging {prepared_request.path_url} after {delay:.2f}s"
+            )
+            futures.append(
+                hedge_pool.submit(self._send, prepared_request.copy(), context)
+            )
+
+        pending = set(futures)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.add_done_callback(_close_response)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def calculate_sync_cost(
+        self,
+        request: requests.PreparedRequest,
+        response: requests.Response,
+        context: Optional[Dict],
+    ) -> Dict[str, int]:
+        """Count each API call, for cost logging and sync planning.
+
+        Args:
+            request: The request that was just sent.
+            response: The response received.
+            context: Stream partition or context dictionary.
+
+        Returns:
+            The cost of the call.
+        """
+        return {"requests": 1}
+
+    def planned_requests(self) -> Optional[int]:
+        """Return the request cost of a stream that is not sized by listing it.
+
+        Returns:
+            None, so that the sync planner probes the stream's first page.
+        """
+        return None
+
+    def _can_offload_parsing(self) -> bool:
+        """Return whether pages of this stream can be parsed in the process pool.
+
+        Only selected leaf streams without replication keys or stream maps
+        qualify, unless they feed the lineage graph: their records are needed
+        for nothing but output.
+
+        Returns:
+            True if parsing can be offloaded.
+        """
+        return (
+            self.offload_parsing
+            and self.selected
+            and not (
+                (
+                    self.name in LINEAGE_SOURCE_STREAMS
+                    or self.name in LINEAGE_LISTING_STREAMS
+                )
+                and self._tap.lineage is not None
+            )
+            and not self.child_streams
+            and self.replication_key is None
+            and not self.config.get("stream_maps")
+            and not self.config.get("flattening_enabled")
+        )
+
+    def _iter_pages(
+        self,
+        context: Optional[Dict],
+        load_page: Optional[Callable[[requests.Response], Tuple]] = None,
+    ) -> Iterable[Tuple[requests.Response, Optional[Tuple]]]:
+        """Request consecutive pages of this stream, in order, up to the last one.
+
+        The stream's paginator decides which page is the last, as it does for
+        pages requested by the SDK. With `page_read_ahead` set, once a page
+        came back full the requests for up to that many following pages are
+        sent on the tap's page pool while it is being consumed; pages read
+        ahead past the last one are discarded. A response with one of
+        `empty_response_codes` is the last page.
+
+        With `load_page`, each page is loaded by the task that requested it,
+        and pagination ends on the record count the loaded page starts with
+        instead of decoding the response again. At least one page is then
+        read ahead, so the next page is requested and loaded while one is
+        consumed.
+
+        Args:
+            context: Stream partition or context dictionary.
+            load_page: Callable loading a response into a tuple whose first
+                item is its record count (see `page_record_count`).
+
+        Yields:
+            Responses, one per page, with the loaded page if `load_page` is set.
+        """
+        decorated_request = self.request_decorator(self._request)
+
+        def fetch(offset: int) -> Tuple[Any, ...]:
+            prepared_request = self.prepare_request(context, next_page_token=offset)
+            response = decorated_request(prepared_request, context)
+            page = None
+            if (
+                load_page is not None
+                and response.status_code not in self.empty_response_codes
+            ):
+                page = load_page(response)
+            return prepared_request, response, page
+
+        paginator = self.get_new_paginator()
+        read_ahead = self.config.get("page_read_ahead", 0)
+        if load_page is not None:
+            read_ahead = max(read_ahead, 1)
+        pending: deque = deque()
+        offset = paginator.current_value
+        with metrics.http_request_counter(self.name, self.path) as request_counter:
+            request_counter.context = context
+            try:
+                while True:
+                    if pending:
+                        prepared_request, response, page = pending.popleft().result()
+                    else:
+                        prepared_request, response, page = fetch(offset)
+                        offset += PAGE_SIZE
+                    request_counter.increment()
+                    self.update_sync_costs(prepared_request, response, context)
+                    if response.status_code in self.empty_response_codes:
+                        has_more = False
+                    elif load_page is not None:
+                        has_more = paginator.has_more_records(page[0])
+                    else:
+                        has_more = paginator.has_more(response)
+                    while has_more and len(pending) < read_ahead:
+                        pending.append(self._tap.submit_page(fetch, offset))
+                        offset += PAGE_SIZE
+                    yield response, page
+                    if not has_more:
+                        return
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def request_records(self, context: Optional[Dict]) -> Iterable[dict]:
+        """Request records, reading pages ahead and offloading parsing if enabled.
+
+        Offloaded pages come back as serialized RECORD messages, yielded as
+        placeholder records that `_write_record_message` writes verbatim.
+
+        Args:
+            context: Stream partition or context dictionary.
+
+        Yields:
+            Record dictionaries, or placeholders holding serialized messages.
+        """
+        parse_pool = self._tap.parse_pool
+        if parse_pool is not None and self._can_offload_parsing():
+            yield from self._request_serialized_records(context, parse_pool)
+            return
+
+        if self.config.get("page_read_ahead"):
+            records = self._request_records_read_ahead(context)
+        else:
+            records = super().request_records(context)
+
+        org_id = (context or {}).get("orgId")
+        for record in records:
+            if org_id is not None:
+                record["orgId"] = org_id
+            yield record
+
+    def _request_records_read_ahead(self, context: Optional[Dict]) -> Iterable[dict]:
+        """Request records page by page, with the following pages read ahead.
+
+        Args:
+            context: Stream partition or context dictionary.
+
+        Yields:
+            Record dictionaries.
+        """
+        for response, _ in self._iter_pages(context):
+            yield from self.parse_response(response)
+
+    def _request_serialized_records(
+        self, context: Optional[Dict], parse_pool: ProcessPoolExecutor
+    ) -> Iterable[dict]:
+        """Request records and parse their pages in the process pool.
+
+        Each page is parsed by the task that requested it, so pages read
+        ahead are parsed concurrently while earlier ones are emitted; pages
+        are emitted in the order they were requested.
+
+        Args:
+            context: Stream partition or context dictionary.
+            parse_pool: Process pool parsing the pages.
+
+        Yields:
+            Placeholders holding serialized RECORD messages.
+        """
+        deselected_properties = [
+            key
+            for key in self.schema.get("properties", {})
+            if not self.mask.get(("properties", key), True)
+        ]
+
+        def parse(response: requests.Response) -> Tuple[Optional[int], List[str]]:
+            return parse_pool.submit(
+                parse_page,
+                response.content,
+                self.name,
+                self.schema,
+                deselected_properties,
+                context,
+                self.TYPE_CONFORMANCE_LEVEL,
+            ).result()
+
+        for _, page in self._iter_pages(context, load_page=parse):
+            if page is None:
+                return
+            for message in page[1]:
+                yield {SERIALIZED_MESSAGE_KEY: message}
+
+    def _write_record_message(self, record: dict) -> None:
+        """Write out a RECORD message, verbatim if it was serialized by a worker.
+
+        Args:
+            record: A single stream record, or a serialized message placeholder.
+        """
+        message = record.get(SERIALIZED_MESSAGE_KEY)
+        if message is None:
+            super()._write_record_message(record)
+            return
+
+        self._tap.write_serialized_message(message)
+        self._is_state_flushed = False
+
+    # The methods below update the tap state; they run under the tap's
+    # `state_lock` so that STATE messages of concurrently synced streams
+    # serialize a consistent snapshot (see `TapSigma.write_message`).
+
+    def get_context_state(self, context: Optional[Dict]) -> Dict:
+        """Return the state of a context, creating it if needed.
+
+        Args:
+            context: Stream partition or context dictionary.
+
+        Returns:
+            The context's writable state.
+        """
+        with self._tap.state_lock:
+            return super().get_context_state(context)
+
+    def _write_starting_replication_value(self, context: Optional[Dict]) -> None:
+        """Store the starting replication value of a context, under the state lock.
+
+        Args:
+            context: Stream partition or context dictionary.
+        """
+        with self._tap.state_lock:
+            super()._write_starting_replication_value(context)
+
+    def _write_replication_key_signpost(
+        self, context: Optional[Dict], value: Any
+    ) -> None:
+        """Store the replication key signpost of a context, under the state lock.
+
+        Args:
+            context: Stream partition or context dictionary.
+            value: The signpost value.
+        """
+        with self._tap.state_lock:
+            super()._write_replication_key_signpost(context, value)
+
+    def _increment_stream_state(
+        self, latest_record: Dict[str, Any], *, context: Optional[Dict] = None
+    ) -> None:
+        """Update state with a record's bookmark, under the state lock.
+
+        Args:
+            latest_record: Record just synced.
+            context: Stream partition or context dictionary.
+        """
+        with self._tap.state_lock:
+            super()._increment_stream_state(latest_record, context=context)
+
+    def _finalize_state(self, state: Optional[Dict] = None) -> None:
+        """Promote progress markers to bookmarks, under the state lock.
+
+        Args:
+            state: State object to promote progress markers with.
+        """
+        with self._tap.state_lock:
+            super()._finalize_state(state)
+
+    def _write_state_message(self) -> None:
+        """Write a STATE message, comparing and copying the state under the lock."""
+        with self._tap.state_lock:
+            super()._write_state_message()
+
     def parse_response(self, response: requests.Response) -> Iterable[dict]:
         """Parse API response and yield records.
 
@@ -145,25 +1352,10 @@ class SigmaStream(RESTStream):
         Yields:
             Record dictionaries.
         """
-        data = response.json()
-
-        # Handle different response formats
-        if isinstance(data, dict):
-            # Check for 'entries' key (common in Sigma API)
-            if "entries" in data:
-                yield from data["entries"]
-            # Check for other common list keys
-            elif any(key in data for key in ["data", "results", "items"]):
-                for key in ["data", "results", "items"]:
-                    if key in data:
-                        yield from data[key]
-                        break
-            # Single object response
-            else:
-                yield data
-        elif isinstance(data, list):
-            # Direct list response
-            yield from data
+        if response.status_code in self.empty_response_codes:
+            return
+
+        yield from extract_records(response.json())
 
     def backoff_wait_generator(self):
         """Generate wait times for backoff with exponential backoff.
@@ -229,5 +1421,8 @@ class SigmaStream(RESTStream):
             # Let backoff_runtime handle the wait time
             raise Exception(msg)
 
+        if response.status_code in self.empty_response_codes:
+            return
+
         # Call parent validation for other status codes
         super().validate_response(response)
@@ -0,0 +1,259 @@
+"""In-process lineage graph of Sigma Computing connections, datasets and workbooks."""
+
+import threading
+from collections import defaultdict, deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# A node is a (type, id) pair, e.g. ("dataset", "ds-1001")
+Node = Tuple[str, str]
+Edge = Tuple[Node, Node]
+
+# State key holding the direct edges of every parent, by org
+LINEAGE_GRAPH_KEY = "graph"
+
+# Streams whose records contribute edges
+LINEAGE_SOURCE_STREAMS = (
+    "datasets",
+    "dataset_sources",
+    "workbook_sources",
+    "workbook_page_elements",
+)
+
+# Parent streams whose complete listings retract the edges of parents that
+# are gone, with the field identifying their records
+LINEAGE_LISTING_STREAMS = {
+    "datasets": "datasetId",
+    "workbooks": "workbookId",
+    "workbook_pages": "pageId",
+}
+
+
+def parent_key(stream_name: str, context: Optional[Dict]) -> str:
+    """Return the key of the parent whose listing produced a set of edges.
+
+    Args:
+        stream_name: Name of the stream the edges come from.
+        context: Context the stream was synced with.
+
+    Returns:
+        A key such as "datasets", "dataset:ds-1", "workbook:wb-1" or
+        "page:wb-1/pg-1".
+    """
+    context = context or {}
+    if stream_name == "datasets":
+        return "datasets"
+    if stream_name == "dataset_sources":
+        return f"dataset:{context.get('datasetId')}"
+    if stream_name == "workbook_sources":
+        return f"workbook:{context.get('workbookId')}"
+    return f"page:{context.get('workbookId')}/{context.get('pageId')}"
+
+
+def _source_edges(target: Node, record: Dict) -> List[Edge]:
+    """Return the edges of a dataset or workbook source record to its target."""
+    edges: List[Edge] = []
+    source_type = record.get("type")
+    connection_id = record.get("connectionId")
+    if source_type == "dataset" and record.get("sourceId"):
+        edges.append((("dataset", record["sourceId"]), target))
+    elif source_type == "table" and record.get("sourceId"):
+        table = ("table", record["sourceId"])
+        edges.append((table, target))
+        if connection_id:
+            edges.append((("connection", connection_id), table))
+    elif connection_id:
+        edges.append((("connection", connection_id), target))
+    return edges
+
+
+def record_edges(stream_name: str, record: Dict) -> List[Edge]:
+    """Return the direct lineage edges of a record, upstream to downstream.
+
+    Datasets link the connection they query to the dataset. Dataset and
+    workbook sources link connections to the tables they hold, and tables or
+    datasets to the dataset or workbook built on them. Page elements link to
+    the workbook they belong to.
+
+    Args:
+        stream_name: Name of the stream the record comes from.
+        record: Post-processed record.
+
+    Returns:
+        Edges as ((type, id), (type, id)) pairs.
+    """
+    edges: List[Edge] = []
+    if stream_name == "datasets" and record.get("connectionId"):
+        dataset = ("dataset", record.get("datasetId"))
+        edges.append((("connection", record["connectionId"]), dataset))
+    elif stream_name == "dataset_sources":
+        edges = _source_edges(("dataset", record.get("datasetId")), record)
+    elif stream_name == "workbook_sources":
+        edges = _source_edges(("workbook", record.get("workbookId")), record)
+    elif stream_name == "workbook_page_elements" and record.get("elementId"):
+        edges.append(
+            (("element", record["elementId"]), ("workbook", record.get("workbookId")))
+        )
+    return [edge for edge in edges if edge[0][1] and edge[1][1]]
+
+
+def _encode(edges: Iterable[Edge]) -> List[List[str]]:
+    return sorted([*source, *target] for source, target in edges)
+
+
+def _decode(rows: Iterable[List[str]]) -> Set[Edge]:
+    return {((row[0], row[1]), (row[2], row[3])) for row in rows}
+
+
+def _reachable(adjacency: Dict[Node, Set[Node]], source: Node) -> Dict[Node, int]:
+    """Return the nodes reachable from a source, with their shortest distance."""
+    depths = {source: 0}
+    queue = deque([source])
+    while queue:
+        node = queue.popleft()
+        for target in sorted(adjacency.get(node, ())):
+            if target not in depths:
+                depths[target] = depths[node] + 1
+                queue.append(target)
+    del depths[source]
+    return depths
+
+
+def _row(source: Node, target: Node, depth: Optional[int]) -> Dict:
+    """Return the closure row of a pair; a deletion marker when depth is None."""
+    return {
+        "sourceType": source[0],
+        "sourceId": source[1],
+        "targetType": target[0],
+        "targetId": target[1],
+        "depth": depth,
+        "isDirect": depth == 1,
+        "isDeleted": depth is None,
+    }
+
+
+class LineageGraph:
+    """Collect lineage edges while their source streams sync.
+
+    Edges are grouped by the parent listing that produced them (the datasets
+    listing, one dataset's or workbook's sources, one workbook page's
+    elements), so that a parent listed again replaces its previous edges
+    while parents not listed in this run keep the edges stored by earlier
+    runs. Parents missing from a complete listing of the datasets, the
+    workbooks or a workbook's pages no longer exist, and their edges are
+    dropped.
+    """
+
+    def __init__(self) -> None:
+        """Initialize graph."""
+        self._lock = threading.Lock()
+        self._updates: Dict[Optional[str], Dict[str, Set[Edge]]] = defaultdict(dict)
+        self._listed: Dict[Optional[str], Dict[str, Set[str]]] = defaultdict(dict)
+
+    def update(
+        self,
+        stream_name: str,
+        context: Optional[Dict],
+        edges: Iterable[Edge],
+        listed_ids: Optional[Iterable[str]] = None,
+    ) -> None:
+        """Record the complete listing of a stream for a context.
+
+        Args:
+            stream_name: Name of the stream that was synced.
+            context: Context the stream was synced with.
+            edges: Edges of every record of the listing (see `record_edges`),
+                which replace the edges of its parent.
+            listed_ids: IDs of every record of a listing in
+                `LINEAGE_LISTING_STREAMS`.
+        """
+        org_id = (context or {}).get("orgId")
+        with self._lock:
+            if stream_name in LINEAGE_SOURCE_STREAMS:
+                self._updates[org_id][parent_key(stream_name, context)] = set(edges)
+            if listed_ids is not None:
+                listing = stream_name
+                if stream_name == "workbook_pages":
+                    listing = f"workbook_pages:{(context or {}).get('workbookId')}"
+                self._listed[org_id][listing] = set(listed_ids)
+
+    @staticmethod
+    def _is_gone(key: str, listed: Dict[str, Set[str]]) -> bool:
+        """Return whether the parent of a graph key is missing from its listing."""
+        kind, _, parent_id = key.partition(":")
+        if kind == "dataset":
+            return parent_id not in listed.get("datasets", {parent_id})
+        if kind == "workbook":
+            return parent_id not in listed.get("workbooks", {parent_id})
+        if kind == "page":
+            workbook_id, _, page_id = parent_id.partition("/")
+            return workbook_id not in listed.get(
+                "workbooks", {workbook_id}
+            ) or page_id not in listed.get(f"workbook_pages:{workbook_id}", {page_id})
+        return False
+
+    def merge(
+        self, org_id: Optional[str], stored: Dict[str, List[List[str]]]
+    ) -> Tuple[Dict[str, List[List[str]]], List[Dict]]:
+        """Merge this run's edges into a stored graph and compute closure rows.
+
+        Edges of parents that are gone are dropped. Only sources whose
+        reachable set may have changed, i.e. nodes upstream of an edge that
+        was added or removed, are recomputed. Without a stored
+        graph every source is. A (source, target) pair that a recomputed
+        source reached in the stored graph but no longer reaches is emitted
+        once more, as a deletion marker.
+
+        Args:
+            org_id: Organization the graph belongs to, or None.
+            stored: Direct edges by parent key, as stored in state.
+
+        Returns:
+            The updated graph to store, and one row per (source, target) pair
+            of every recomputed source: with the shortest path length, or with
+            `isDeleted` set and no depth for pairs no longer connected.
+        """
+        with self._lock:
+            updates = dict(self._updates.get(org_id, {}))
+            listed = dict(self._listed.get(org_id, {}))
+
+        old_graph = {key: _decode(rows) for key, rows in stored.items()}
+        new_graph = {
+            key: edges
+            for key, edges in {**old_graph, **updates}.items()
+            if not self._is_gone(key, listed)
+        }
+        old_edges = set().union(*old_graph.values()) if old_graph else set()
+        new_edges = set().union(*new_graph.values()) if new_graph else set()
+
+        adjacency: Dict[Node, Set[Node]] = defaultdict(set)
+        for source, target in new_edges:
+            adjacency[source].add(target)
+        old_adjacency: Dict[Node, Set[Node]] = defaultdict(set)
+        for source, target in old_edges:
+            old_adjacency[source].add(target)
+
+        if stored:
+            reverse: Dict[Node, Set[Node]] = defaultdict(set)
+            for source, target in old_edges | new_edges:
+                reverse[target].add(source)
+            affected = {source for source, _ in old_edges ^ new_edges}
+            queue = deque(affected)
+            while queue:
+                for upstream in reverse[queue.popleft()]:
+                    if upstream not in affected:
+                        affected.add(upstream)
+                        queue.append(upstream)
+        else:
+            affected = set(adjacency)
+
+        rows = []
+        for source in sorted(affected):
+            depths = _reachable(adjacency, source)
+            for target, depth in depths.items():
+                rows.append(_row(source, target, depth))
+            for target in sorted(set(_reachable(old_adjacency, source)) - set(depths)):
+                rows.append(_row(source, target, None))
+
+        graph = {key: _encode(edges) for key, edges in sorted(new_graph.items())}
+        return graph, rows
+
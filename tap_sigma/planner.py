@@ -0,0 +1,200 @@
+"""Cost-based planning of Sigma Computing stream syncs."""
+
+import math
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional
+
+from singer_sdk import Stream
+
+if TYPE_CHECKING:
+    from tap_sigma.tap import TapSigma
+
+# State key holding the request metrics of the previous run for each stream
+SYNC_METRICS_KEY = "sync_metrics"
+
+PAGE_SIZE = 100
+
+# Assumed when nothing is known: one request and one child per context
+DEFAULT_METRICS = {"contexts": 1, "requests": 1, "child_contexts": 1}
+
+
+class StreamEstimate(NamedTuple):
+    """Estimated request cost of syncing one top-level stream and its children."""
+
+    stream: str
+    requests: int
+    source: str
+
+
+class SyncPlanner:
+    """Estimate the request cost of selected stream trees and order them.
+
+    Costs come from the metrics of the previous run stored in state (requests
+    per context and child contexts per context for every stream). Top-level
+    streams without history that state their own cost (`planned_requests`),
+    such as derived and export streams, are not probed; others can be probed
+    with a single listing request. Anything else falls back to one request
+    and one child per parent.
+    """
+
+    def __init__(self, tap: "TapSigma", probe: bool = True) -> None:
+        """Initialize planner.
+
+        Args:
+            tap: The tap whose streams are planned.
+            probe: Whether to probe top-level streams that have no history.
+        """
+        self.tap = tap
+        self.probe = probe
+
+    def _history(self, stream: Stream) -> Optional[Dict[str, int]]:
+        bookmarks = self.tap.state.get("bookmarks", {})
+        metrics = bookmarks.get(stream.name, {}).get(SYNC_METRICS_KEY)
+        if metrics and metrics.get("contexts"):
+            return {**DEFAULT_METRICS, **metrics}
+        return None
+
+    def _probe(self, stream: Stream) -> Optional[Dict[str, int]]:
+        """List the first page of a top-level stream to size it.
+
+        Streams partitioned by organization are probed on the first one.
+
+        Args:
+            stream: Top-level stream to probe.
+
+        Returns:
+            Metrics shaped like the stored history, or None if the probe failed.
+        """
+        partitions = stream.partitions or [None]
+        try:
+            prepared_request = stream.prepare_request(partitions[0], next_page_token=0)
+            response = stream.request_decorator(stream._request)(
+                prepared_request, partitions[0]
+            )
+            data = response.json()
+        except Exception as ex:
+            self.tap.logger.warning(f"Could not probe '{stream.name}': {ex}")
+            return None
+
+        if isinstance(data, dict):
+            record_count = data.get("total") or len(data.get("entries", []))
+        elif isinstance(data, list):
+            record_count = len(data)
+        else:
+            record_count = 1
+        # Other partitions (organizations) are assumed to be of the same size
+        return {
+            "contexts": 1,
+            "requests": len(partitions) * max(1, math.ceil(record_count / PAGE_SIZE)),
+            "child_contexts": len(partitions) * record_count,
+        }
+
+    def _estimate(
+        self,
+        stream: Stream,
+        contexts: float,
+        metrics: Optional[Dict[str, int]] = None,
+    ) -> float:
+        """Estimate requests for a stream synced with a number of contexts.
+
+        Args:
+            stream: Stream to estimate.
+            contexts: Number of contexts (parents) the stream is synced with.
+            metrics: Metrics to use instead of the stream's history.
+
+        Returns:
+            Estimated number of requests for the stream and its descendants.
+        """
+        metrics = metrics or self._history(stream) or DEFAULT_METRICS
+        per_context = metrics["requests"] / metrics["contexts"]
+        children_per_context = metrics["child_contexts"] / metrics["contexts"]
+        return contexts * per_context + sum(
+            self._estimate(child, contexts * children_per_context)
+            for child in stream.child_streams
+            if child.selected or child.has_selected_descendents
+        )
+
+    def estimate(self, stream: Stream) -> StreamEstimate:
+        """Estimate the request cost of a top-level stream tree.
+
+        Args:
+            stream: Top-level stream.
+
+        Returns:
+            The estimate, with the source of the top-level metrics.
+        """
+        metrics = self._history(stream)
+        source = "history"
+        if metrics is None:
+            planned_requests = getattr(stream, "planned_requests", None)
+            requests = planned_requests() if planned_requests else None
+            if requests is not None:
+                return StreamEstimate(stream.name, requests, "config")
+        if metrics is None and self.probe:
+            metrics = self._probe(stream)
+            source = "probe"
+        if metrics is None:
+            metrics = DEFAULT_METRICS
+            source = "default"
+
+        requests = self._estimate(stream, 1, metrics)
+        return StreamEstimate(stream.name, int(math.ceil(requests)), source)
+
+    def plan(self, streams: List[Stream]) -> List[StreamEstimate]:
+        """Order top-level streams by estimated cost, most expensive first.
+
+        Streams listed in another stream's `sync_after` are moved ahead of it.
+
+        Args:
+            streams: Top-level streams to sync.
+
+        Returns:
+            Estimates in the order the streams should be synced.
+        """
+        estimates = {stream.name: self.estimate(stream) for stream in streams}
+        by_cost = sorted(
+            streams, key=lambda stream: estimates[stream.name].requests, reverse=True
+        )
+        return [estimates[stream.name] for stream in dependencies_first(by_cost)]
+
+
+def dependencies_first(streams: List[Stream]) -> List[Stream]:
+    """Move the streams named in another stream's `sync_after` ahead of it.
+
+    Args:
+        streams: Top-level streams, in the order they would otherwise sync.
+
+    Returns:
+        The same streams, otherwise in their given order.
+    """
+    by_name = {stream.name: stream for stream in streams}
+    ordered: List[Stream] = []
+    added = set()
+
+    def add(stream: Stream) -> None:
+        if stream.name in added:
+            return
+        added.add(stream.name)
+        for dependency in getattr(stream, "sync_after", ()):
+            if dependency in by_name:
+                add(by_name[dependency])
+        ordered.append(stream)
+
+    for stream in streams:
+        add(stream)
+    return ordered
+
+
+def record_sync_metrics(stream: Stream) -> None:
+    """Store the request metrics of this run in the stream's state.
+
+    Args:
+        stream: A stream that has finished syncing.
+    """
+    contexts = getattr(stream, "_contexts_synced", 0)
+    if not contexts:
+        return
+    stream.stream_state[SYNC_METRICS_KEY] = {
+        "contexts": contexts,
+        "requests": stream._sync_costs.get("requests", 0),
+        "child_contexts": getattr(stream, "_child_contexts_generated", 0),
+    }
@@ -0,0 +1,51 @@
+"""Request rate limiting for Sigma Computing API calls."""
+
+import threading
+import time
+from collections import deque
+
+
+class RateLimiter:
+    """Thread-safe sliding-window limiter of requests per period."""
+
+    def __init__(self, max_requests: int, period_seconds: float = 60.0) -> None:
+        """Initialize limiter.
+
+        Args:
+            max_requests: Maximum number of requests allowed per period.
+            period_seconds: Length of the sliding window in seconds.
+        """
+        self.max_requests = max_requests
+        self.period_seconds = period_seconds
+        self._lock = threading.Lock()
+        self._sent: deque = deque()
+
+    def _expire(self, now: float) -> None:
+        while self._sent and now - self._sent[0] >= self.period_seconds:
+            self._sent.popleft()
+
+    def try_acquire(self) -> bool:
+        """Take a request slot if one is free, without waiting.
+
+        Returns:
+            True if a slot was taken.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            if len(self._sent) < self.max_requests:
+                self._sent.append(now)
+                return True
+            return False
+
+    def acquire(self) -> None:
+        """Block until a request slot is free, then take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._expire(now)
+                if len(self._sent) < self.max_requests:
+                    self._sent.append(now)
+                    return
+                wait_time = self.period_seconds - (now - self._sent[0])
+            time.sleep(max(wait_time, 0.01))
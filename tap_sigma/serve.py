@@ -0,0 +1,250 @@
+"""Long-running server running Sigma Computing syncs on a schedule or on demand."""
+
+import copy
+import json
+import logging
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import click
+
+from tap_sigma.tap import TapSigma
+
+logger = logging.getLogger(__name__)
+
+
+class SyncServer:
+    """Run syncs in one resident process, keeping tap resources warm.
+
+    Every run uses a fresh `TapSigma` instance (and so a fresh catalog,
+    counters and metrics) but takes over the previous run's HTTP connection
+    pools, rate budgets, worker pools, parent cache and member index. The
+    access token is shared by all streams of the process, so it is only
+    requested again when it expires. State is carried from run to run and
+    written back to the state file after each run.
+    """
+
+    def __init__(
+        self,
+        config_files: Sequence[str],
+        catalog: Optional[str] = None,
+        state_path: Optional[str] = None,
+        output: str = "tap-sigma-{run_id}.jsonl",
+        interval_seconds: Optional[float] = None,
+        parse_env_config: bool = False,
+    ) -> None:
+        """Initialize server.
+
+        Args:
+            config_files: Tap config file paths.
+            catalog: Catalog file path; all streams are synced when unset.
+            state_path: State file read at startup and rewritten after each run.
+            output: Path of the file (or named pipe) each run's Singer output is
+                written to; `{run_id}` is replaced with the run's timestamp.
+            interval_seconds: Seconds between scheduled runs; when unset, runs
+                only happen when triggered.
+            parse_env_config: Whether to read config from environment variables.
+        """
+        self.config_files = list(config_files)
+        self.catalog = catalog
+        self.state_path = state_path
+        self.output = output
+        self.interval_seconds = interval_seconds
+        self.parse_env_config = parse_env_config
+
+        self.state: Dict[str, Any] = {}
+        if state_path and Path(state_path).exists():
+            self.state = json.loads(Path(state_path).read_text())
+
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._tap: Optional[TapSigma] = None
+        self._run_lock = threading.Lock()
+        self._triggered = threading.Event()
+        self._stopped = threading.Event()
+
+    def run_once(self, reason: str = "triggered") -> Dict[str, Any]:
+        """Run one sync and write its output to a new file.
+
+        Args:
+            reason: Why the run was started, reported in the run summary.
+
+        Returns:
+            Summary of the run.
+        """
+        with self._run_lock:
+            run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+            output_path = self.output.format(run_id=run_id)
+            started_at = time.monotonic()
+
+            tap = TapSigma(
+                config=self.config_files,
+                catalog=self.catalog,
+                state=copy.deepcopy(self.state),
+                parse_env_config=self.parse_env_config,
+                validate_config=True,
+            )
+            if self._tap is not None:
+                tap.reuse_resources(self._tap)
+            tap.keep_resources = True
+            self._tap = tap
+
+            with open(output_path, "w", encoding="utf-8") as output:
+                tap.output = output
+                tap.sync_all()
+
+            self.state = copy.deepcopy(tap.state)
+            if self.state_path:
+                Path(self.state_path).write_text(json.dumps(self.state))
+
+            self.last_run = {
+                "run_id": run_id,
+                "reason": reason,
+                "output": output_path,
+                "duration_seconds": round(time.monotonic() - started_at, 3),
+                "stop_reason": tap.stop_reason,
+            }
+            logger.info(f"Finished run {run_id} ({reason}) into {output_path}")
+            return self.last_run
+
+    def trigger(self) -> None:
+        """Start a run as soon as the current one (if any) has finished."""
+        self._triggered.set()
+
+    def stop(self) -> None:
+        """Stop serving after the current run."""
+        self._stopped.set()
+        self._triggered.set()
+
+    def serve_forever(self, port: Optional[int] = None) -> None:
+        """Run scheduled and triggered syncs until stopped.
+
+        Args:
+            port: Local port of the HTTP endpoint (`POST /sync` triggers a run,
+                `GET /status` returns the last run). No endpoint when unset.
+        """
+        http_server = None
+        if port is not None:
+            http_server = ThreadingHTTPServer(("127.0.0.1", port), _handler(self))
+            threading.Thread(
+                target=http_server.serve_forever, name="tap-sigma-serve", daemon=True
+            ).start()
+            logger.info(f"Listening for sync triggers on http://127.0.0.1:{port}")
+
+        next_run = time.monotonic()
+        try:
+            while not self._stopped.is_set():
+                timeout = None
+                if self.interval_seconds:
+                    timeout = max(next_run - time.monotonic(), 0)
+                triggered = self._triggered.wait(timeout)
+                self._triggered.clear()
+                if self._stopped.is_set():
+                    break
+                if not triggered:
+                    next_run = time.monotonic() + self.interval_seconds
+                try:
+                    self.run_once("triggered" if triggered else "scheduled")
+                except Exception:
+                    logger.exception("Sync run failed")
+        finally:
+            if http_server is not None:
+                http_server.shutdown()
+            self.close()
+
+    def close(self) -> None:
+        """Release the resources kept warm between runs."""
+        with self._run_lock:
+            if self._tap is not None:
+                self._tap.close_resources()
+                self._tap = None
+
+
+def _handler(server: SyncServer) -> type:
+    """Return an HTTP request handler class bound to a sync server.
+
+    Args:
+        server: The server runs are triggered on.
+
+    Returns:
+        The request handler class.
+    """
+
+    class SyncRequestHandler(BaseHTTPRequestHandler):
+        def _respond(self, status: int, body: Any) -> None:
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self) -> None:  # noqa: N802
+            if self.path != "/sync":
+                self._respond(404, {"error": "not found"})
+                return
+            server.trigger()
+            self._respond(202, {"status": "triggered"})
+
+        def do_GET(self) -> None:  # noqa: N802
+            if self.path != "/status":
+                self._respond(404, {"error": "not found"})
+                return
+            self._respond(200, {"last_run": server.last_run})
+
+        def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+            logger.debug(format, *args)
+
+    return SyncRequestHandler
+
+
+@click.command(name="serve")
+@click.option(
+    "--config",
+    multiple=True,
+    help="Configuration file location or 'ENV' to use environment variables.",
+)
+@click.option("--catalog", help="Use a Singer catalog file with the tap.")
+@click.option("--state", help="State file, read at startup and updated after each run.")
+@click.option(
+    "--output",
+    default="tap-sigma-{run_id}.jsonl",
+    show_default=True,
+    help="File or named pipe each run writes Singer messages to.",
+)
+@click.option("--interval", type=float, help="Seconds between scheduled runs.")
+@click.option("--port", type=int, help="Local port of the HTTP trigger endpoint.")
+def serve(
+    config: List[str],
+    catalog: Optional[str],
+    state: Optional[str],
+    output: str,
+    interval: Optional[float],
+    port: Optional[int],
+) -> None:
+    """Keep a tap process resident and run syncs on a schedule or on demand."""
+    config_files, parse_env_config = TapSigma.config_from_cli_args(*config)
+    server = SyncServer(
+        config_files,
+        catalog=catalog,
+        state_path=state,
+        output=output,
+        interval_seconds=interval,
+        parse_env_config=parse_env_config,
+    )
+    try:
+        server.serve_forever(port=port)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+def main() -> None:
+    """Run `tap-sigma serve`, or the regular tap CLI for any other arguments."""
+    if sys.argv[1:2] == ["serve"]:
+        serve(sys.argv[2:], prog_name="tap-sigma serve")
+    else:
+        TapSigma.cli()
@@ -1,10 +1,19 @@
 """Stream definitions for Sigma Computing API."""
 
-from typing import Any, Dict, Optional
-
+import csv
+import io
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import requests
 from singer_sdk import typing as th
 
-from tap_sigma.client import SigmaStream
+from tap_sigma.client import BudgetExhaustedError, SigmaStream
+from tap_sigma.lineage import LINEAGE_GRAPH_KEY
+from tap_sigma.ratelimit import RateLimiter
 
 
 class AccountTypesStream(SigmaStream):
@@ -105,6 +114,8 @@ class MembersStream(SigmaStream):
     path = "/v2/members"
     primary_keys = ["memberId"]
     replication_key = None
+    # post_process feeds the member index, so records are parsed in-process
+    offload_parsing = False
 
     schema = th.PropertiesList(
         th.Property("memberId", th.StringType),
@@ -117,6 +128,17 @@ class MembersStream(SigmaStream):
         th.Property("updatedAt", th.DateTimeType),
     ).to_dict()
 
+    def post_process(self, row: dict, context: Optional[Dict] = None) -> dict:
+        """Add each member to the tap's member index when it is enabled."""
+        member_index = self._tap.member_index
+        if member_index is not None and row.get("memberId"):
+            member_index[row["memberId"]] = (
+                row.get("email"),
+                row.get("firstName"),
+                row.get("lastName"),
+            )
+        return row
+
 
 class TeamsStream(SigmaStream):
     """Teams stream."""
@@ -125,6 +147,8 @@ class TeamsStream(SigmaStream):
     path = "/v2/teams"
     primary_keys = ["teamId"]
     replication_key = None
+    # Members are indexed first so team memberships can be denormalized
+    sync_after = ("members",)
 
     schema = th.PropertiesList(
         th.Property("teamId", th.StringType),
@@ -136,6 +160,53 @@ class TeamsStream(SigmaStream):
         th.Property("updatedAt", th.DateTimeType),
     ).to_dict()
 
+    def get_child_context(self, record: dict, context: Optional[Dict] = None) -> dict:
+        """Return context for child streams."""
+        _ = context  # Unused
+        return {"teamId": record["teamId"]}
+
+
+class TeamMembersStream(SigmaStream):
+    """Team members stream (child of teams).
+
+    Memberships are fetched concurrently for batches of teams. When
+    `denormalize_team_members` is enabled, member email and name are filled
+    in from the members synced earlier in the run.
+    """
+
+    name = "team_members"
+    primary_keys = ["teamId", "memberId"]
+    replication_key = None
+    parent_stream_type = TeamsStream
+    prefetch_from_parent = True
+    offload_parsing = False
+
+    @property
+    def path(self) -> str:
+        """Return the path for this stream."""
+        return "/v2/teams/{teamId}/members"
+
+    schema = th.PropertiesList(
+        th.Property("teamId", th.StringType),
+        th.Property("memberId", th.StringType),
+        th.Property("email", th.StringType),
+        th.Property("firstName", th.StringType),
+        th.Property("lastName", th.StringType),
+    ).to_dict()
+
+    def post_process(self, row: dict, context: Optional[Dict] = None) -> dict:
+        """Add teamId from context and member details from the member index."""
+        if context and "teamId" in context:
+            row["teamId"] = context["teamId"]
+
+        member_index = self._tap.member_index
+        if member_index is not None and row.get("memberId") in member_index:
+            email, first_name, last_name = member_index[row["memberId"]]
+            row.setdefault("email", email)
+            row.setdefault("firstName", first_name)
+            row.setdefault("lastName", last_name)
+        return row
+
 
 class FilesStream(SigmaStream):
     """Files stream."""
@@ -339,6 +410,7 @@ class DatasetMaterializationsStream(SigmaStream):
     primary_keys = ["datasetId"]  # No unique materializationId in API response
     replication_key = None
     parent_stream_type = DatasetsStream
+    empty_response_codes = (400, 404)
 
     @property
     def path(self) -> str:
@@ -427,6 +499,7 @@ class WorkbookSchedulesStream(SigmaStream):
     primary_keys = ["workbookId", "scheduleId"]
     replication_key = None
     parent_stream_type = WorkbooksStream
+    empty_response_codes = (400, 404)
 
     @property
     def path(self) -> str:
@@ -458,6 +531,7 @@ class WorkbookMaterializationSchedulesStream(SigmaStream):
     primary_keys = ["workbookId", "scheduleId"]
     replication_key = None
     parent_stream_type = WorkbooksStream
+    empty_response_codes = (400, 404)
 
     @property
     def path(self) -> str:
@@ -480,6 +554,34 @@ class WorkbookMaterializationSchedulesStream(SigmaStream):
         return row
 
 
+class WorkbookSourcesStream(SigmaStream):
+    """Workbook sources stream: the datasets and tables a workbook is built on."""
+
+    name = "workbook_sources"
+    primary_keys = ["workbookId", "sourceId"]
+    replication_key = None
+    parent_stream_type = WorkbooksStream
+
+    @property
+    def path(self) -> str:
+        """Return the path for this stream."""
+        return "/v2/workbooks/{workbookId}/sources"
+
+    schema = th.PropertiesList(
+        th.Property("workbookId", th.StringType),
+        th.Property("sourceId", th.StringType),
+        th.Property("name", th.StringType),
+        th.Property("type", th.StringType),
+        th.Property("connectionId", th.StringType),
+    ).to_dict()
+
+    def post_process(self, row: dict, context: Optional[Dict] = None) -> dict:
+        """Add workbookId from context to each record."""
+        if context and "workbookId" in context:
+            row["workbookId"] = context["workbookId"]
+        return row
+
+
 class WorkbookPageElementsStream(SigmaStream):
     """Workbook page elements stream."""
 
@@ -512,3 +614,256 @@ class WorkbookPageElementsStream(SigmaStream):
             if "pageId" in context:
                 row["pageId"] = context["pageId"]
         return row
+
+
+class WorkbookElementExportsStream(SigmaStream):
+    """Workbook element data exports stream.
+
+    Exports the data of each element listed in the `export_elements` setting.
+    Export jobs are submitted in a pipeline under the export rate limit, up to
+    `export_max_in_flight` jobs are polled concurrently, and each finished
+    export is streamed into records without buffering the whole file.
+    """
+
+    name = "workbook_element_exports"
+    primary_keys = ["workbookId", "elementId", "rowIndex"]
+    replication_key = None
+
+    @property
+    def path(self) -> str:
+        """Return the path for this stream."""
+        return "/v2/workbooks/{workbookId}/export"
+
+    schema = th.PropertiesList(
+        th.Property("workbookId", th.StringType),
+        th.Property("pageId", th.StringType),
+        th.Property("elementId", th.StringType),
+        th.Property("queryId", th.StringType),
+        th.Property("rowIndex", th.IntegerType),
+        th.Property("row", th.CustomType({"type": ["object", "null"]})),
+    ).to_dict()
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        """Initialize stream with a limiter for the export endpoints."""
+        super().__init__(*args, **kwargs)
+        self._rate_limiter = RateLimiter(
+            self.config.get("export_requests_per_minute", 100), period_seconds=60
+        )
+
+    @property
+    def partitions(self) -> Optional[List[Dict]]:
+        """Return no partitions; export targets name their own organization."""
+        return None
+
+    def planned_requests(self) -> Optional[int]:
+        """Return one job submission and one download per configured element.
+
+        Polls of exports that are not ready yet are not counted.
+
+        Returns:
+            The estimated number of requests.
+        """
+        return 2 * len(self.config.get("export_elements") or [])
+
+    def get_records(self, context: Optional[Dict]) -> Iterable[Dict[str, Any]]:
+        """Run the configured exports and yield one record per exported row.
+
+        Args:
+            context: Stream partition or context dictionary.
+
+        Yields:
+            Record dictionaries, grouped by element in configured order.
+        """
+        targets = iter(self.config.get("export_elements") or [])
+        max_in_flight = self.config.get("export_max_in_flight", 10)
+
+        with ThreadPoolExecutor(
+            max_workers=max_in_flight, thread_name_prefix="sigma-export"
+        ) as executor:
+            in_flight: deque = deque()
+            for target in targets:
+                in_flight.append((target, executor.submit(self._run_export, target)))
+                if len(in_flight) >= max_in_flight:
+                    break
+
+            while in_flight:
+                target, future = in_flight.popleft()
+                try:
+                    query_id, response = future.result()
+                except BudgetExhaustedError:
+                    self._tap.sync_interrupted = True
+                    continue
+                # No new exports once the run's budget is spent
+                next_target = None
+                if self._tap.stop_reason is None:
+                    next_target = next(targets, None)
+                elif next(targets, None) is not None:
+                    self._tap.sync_interrupted = True
+                if next_target is not None:
+                    in_flight.append(
+                        (next_target, executor.submit(self._run_export, next_target))
+                    )
+
+                try:
+                    for index, row in enumerate(self._iter_rows(response)):
+                        record = {
+                            "workbookId": target["workbookId"],
+                            "pageId": target.get("pageId"),
+                            "elementId": target["elementId"],
+                            "queryId": query_id,
+                            "rowIndex": index,
+                            "row": row,
+                        }
+                        if "orgId" in target:
+                            record["orgId"] = target["orgId"]
+                        yield record
+                finally:
+                    response.close()
+
+    def _run_export(self, target: Dict) -> Tuple[str, requests.Response]:
+        """Submit an export job and poll until its download is ready.
+
+        Args:
+            target: Element to export, with `workbookId` and `elementId`.
+
+        Returns:
+            The export query ID and the open, streaming download response.
+
+        Polls and the download go through `_request`, so they count toward
+        `max_requests`, are recorded by the cassette and stop once the run's
+        budget is spent; throttled polls are retried with backoff.
+
+        Raises:
+            RuntimeError: If the export is not ready within the export timeout.
+        """
+        self._rate_limiter.acquire()
+        prepared_request = self.build_request(
+            target,
+            method="POST",
+            url=self.get_url(target),
+            headers=self.http_headers,
+            json={
+                "elementId": target["elementId"],
+                "format": {"type": self.config.get("export_format", "csv")},
+            },
+        )
+        response = self.request_decorator(self._request)(prepared_request, target)
+        self.update_sync_costs(prepared_request, response, target)
+        query_id = response.json()["queryId"]
+
+        organization = self._organization(target)
+        api_url = organization["api_url"].rstrip("/") if organization else self.url_base
+        download_url = f"{api_url}/v2/query/{query_id}/download"
+        poll_interval = self.config.get("export_poll_interval_seconds", 5)
+        deadline = time.monotonic() + self.config.get("export_timeout_seconds", 3600)
+        while True:
+            self._rate_limiter.acquire()
+            prepared_request = self.build_request(
+                target, method="GET", url=download_url, headers=self.http_headers
+            )
+            response = self.request_decorator(self._request)(
+                prepared_request, target, stream=True
+            )
+            self.update_sync_costs(prepared_request, response, target)
+            if response.status_code == 200:
+                return query_id, response
+
+            # Export still running: wait and poll again
+            response.close()
+
+            if time.monotonic() > deadline:
+                msg = (
+                    f"Export of element {target['elementId']} "
+                    f"(query {query_id}) was not ready in time"
+                )
+                raise RuntimeError(msg)
+            time.sleep(poll_interval)
+
+    def _iter_rows(self, response: requests.Response) -> Iterable[Dict[str, Any]]:
+        """Stream rows out of an export download.
+
+        Args:
+            response: Open download response created with `stream=True`.
+
+        Yields:
+            One dictionary per exported row.
+        """
+        response.raw.decode_content = True
+        text = io.TextIOWrapper(response.raw, encoding="utf-8", newline="")
+        if self.config.get("export_format", "csv") == "csv":
+            yield from csv.DictReader(text)
+        else:
+            for line in text:
+                if line.strip():
+                    yield json.loads(line)
+
+
+# Derived streams
+class LineageEdgesStream(SigmaStream):
+    """Lineage edges stream, derived from datasets, sources and page elements.
+
+    Built in-process from the `datasets`, `dataset_sources`,
+    `workbook_sources` and `workbook_page_elements` records synced in the
+    same run, so those streams must be selected for the graph to change.
+    Emits the direct edges (connection -> table -> dataset -> dataset ->
+    workbook, connection -> dataset, element -> workbook) together with their
+    transitive closure, so that every workbook downstream of a connection or
+    dataset is one row away. The direct edges are kept in state, and only
+    sources upstream of an edge that changed since the previous run are
+    emitted again; pairs they no longer reach are emitted with `isDeleted`
+    set.
+
+    With `shard_count` > 1 each shard only sees the sources and page elements
+    of its own parents, so its graph, and the closure it emits, is
+    incomplete.
+    """
+
+    name = "lineage_edges"
+    path = "/lineage"
+    primary_keys = ["sourceType", "sourceId", "targetType", "targetId"]
+    replication_key = None
+    sync_after = ("datasets", "workbooks")
+    offload_parsing = False
+
+    schema = th.PropertiesList(
+        th.Property("sourceType", th.StringType),
+        th.Property("sourceId", th.StringType),
+        th.Property("targetType", th.StringType),
+        th.Property("targetId", th.StringType),
+        th.Property("depth", th.IntegerType),
+        th.Property("isDirect", th.BooleanType),
+        th.Property("isDeleted", th.BooleanType),
+    ).to_dict()
+
+    def planned_requests(self) -> Optional[int]:
+        """Return no requests: the graph is built from other streams' records.
+
+        Returns:
+            Zero.
+        """
+        return 0
+
+    def get_records(self, context: Optional[Dict]) -> Iterable[Dict[str, Any]]:
+        """Merge this run's edges into the stored graph and yield closure rows.
+
+        Args:
+            context: Stream partition (organization) or None.
+
+        Yields:
+            One record per (source, target) pair of every recomputed source.
+        """
+        if self.config.get("shard_count", 1) > 1:
+            self.logger.warning(
+                "Lineage is built from this shard's parents only and is "
+                "incomplete with shard_count > 1"
+            )
+        org_id = (context or {}).get("orgId")
+        state = self.get_context_state(context)
+        stored = state.get(LINEAGE_GRAPH_KEY, {})
+        graph, rows = self._tap.lineage.merge(org_id, stored)
+        with self._tap.state_lock:
+            state[LINEAGE_GRAPH_KEY] = graph
+        for row in rows:
+            if org_id is not None:
+                row["orgId"] = org_id
+            yield row
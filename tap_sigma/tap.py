@@ -1,11 +1,32 @@
 """Sigma Computing tap class."""
 
-from typing import List
+import json
+import multiprocessing
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import IO, Any, Callable, Dict, List, Optional, Sequence, Tuple
 
-from singer_sdk import Stream, Tap
+import click
+import requests
+from singer_sdk import Stream, Tap, metrics
 from singer_sdk import typing as th
+from singer_sdk._singerlib import Message, StateMessage
+from singer_sdk._singerlib.messages import format_message
+from singer_sdk.exceptions import ConfigValidationError
 
 from tap_sigma import streams
+from tap_sigma.cache import ParentContextCache
+from tap_sigma.cassette import Cassette
+from tap_sigma.lineage import LineageGraph
+from tap_sigma.planner import (
+    StreamEstimate,
+    SyncPlanner,
+    dependencies_first,
+    record_sync_metrics,
+)
+from tap_sigma.ratelimit import RateLimiter
 
 
 class TapSigma(Tap):
@@ -17,24 +38,28 @@ class TapSigma(Tap):
         th.Property(
             "client_id",
             th.StringType,
-            required=True,
             secret=True,
-            description="Sigma Computing API Client ID",
+            description=(
+                "Sigma Computing API Client ID. Required unless `organizations` "
+                "is set"
+            ),
         ),
         th.Property(
             "client_secret",
             th.StringType,
-            required=True,
             secret=True,
-            description="Sigma Computing API Client Secret",
+            description=(
+                "Sigma Computing API Client Secret. Required unless "
+                "`organizations` is set"
+            ),
         ),
         th.Property(
             "api_url",
             th.StringType,
-            required=True,
             description=(
                 "Base API URL for your Sigma Computing instance "
-                "(e.g., https://aws-api.sigmacomputing.com)"
+                "(e.g., https://aws-api.sigmacomputing.com). Required unless "
+                "`organizations` is set"
             ),
         ),
         th.Property(
@@ -42,15 +67,734 @@ class TapSigma(Tap):
             th.DateTimeType,
             description="Earliest record date to sync",
         ),
+        th.Property(
+            "parent_cache_path",
+            th.StringType,
+            description=(
+                "Path of a local SQLite file caching parent stream contexts "
+                "(workbook IDs, workbook/page ID pairs, ...). When set, child "
+                "streams selected without their parent fan out from the cache "
+                "instead of re-listing the parent"
+            ),
+        ),
+        th.Property(
+            "parent_cache_ttl_seconds",
+            th.IntegerType,
+            default=86400,
+            description=(
+                "Age in seconds after which cached parent contexts are stale. "
+                "Stale contexts are still served and refreshed in the background"
+            ),
+        ),
+        th.Property(
+            "shard_index",
+            th.IntegerType,
+            default=0,
+            description=(
+                "Zero-based index of this tap process when child stream work is "
+                "sharded across `shard_count` processes. Only shard 0 emits "
+                "top-level streams"
+            ),
+        ),
+        th.Property(
+            "shard_count",
+            th.IntegerType,
+            default=1,
+            description=(
+                "Number of tap processes sharing child stream work. Parent keys "
+                "(workbookId, datasetId) are hash-partitioned across shards"
+            ),
+        ),
+        th.Property(
+            "export_elements",
+            th.ArrayType(
+                th.ObjectType(
+                    th.Property("workbookId", th.StringType, required=True),
+                    th.Property("elementId", th.StringType, required=True),
+                    th.Property("pageId", th.StringType),
+                    th.Property("orgId", th.StringType),
+                )
+            ),
+            description=(
+                "Workbook elements whose data is exported into the "
+                "`workbook_element_exports` stream"
+            ),
+        ),
+        th.Property(
+            "export_format",
+            th.StringType,
+            default="csv",
+            allowed_values=["csv", "jsonl"],
+            description="File format requested from the export endpoints",
+        ),
+        th.Property(
+            "export_requests_per_minute",
+            th.IntegerType,
+            default=100,
+            description="Request budget for the export endpoints (Sigma allows 100/min)",
+        ),
+        th.Property(
+            "export_max_in_flight",
+            th.IntegerType,
+            default=10,
+            description="Maximum number of export jobs submitted and polled at once",
+        ),
+        th.Property(
+            "export_poll_interval_seconds",
+            th.NumberType,
+            default=5,
+            description="Seconds between polls of an unfinished export job",
+        ),
+        th.Property(
+            "export_timeout_seconds",
+            th.IntegerType,
+            default=3600,
+            description="Seconds to wait for an export job before failing the sync",
+        ),
+        th.Property(
+            "max_workers",
+            th.IntegerType,
+            default=8,
+            description=(
+                "Size of the worker pool used for concurrent requests, such as "
+                "fetching team memberships for many teams at once"
+            ),
+        ),
+        th.Property(
+            "denormalize_team_members",
+            th.BooleanType,
+            default=False,
+            description=(
+                "Index members while the `members` stream syncs and add member "
+                "email and name to `team_members` records"
+            ),
+        ),
+        th.Property(
+            "plan_sync",
+            th.BooleanType,
+            default=False,
+            description=(
+                "Estimate the request cost of each selected stream tree from the "
+                "previous run's metrics (or a one-page probe) and sync the most "
+                "expensive fan-outs first"
+            ),
+        ),
+        th.Property(
+            "negative_cache_ttl_seconds",
+            th.IntegerType,
+            default=604800,
+            description=(
+                "Seconds to skip parents whose dataset materialization or workbook "
+                "schedules came back empty or 400/404, unless the parent's "
+                "updatedAt changes. 0 disables the cache"
+            ),
+        ),
+        th.Property(
+            "circuit_breaker_threshold",
+            th.IntegerType,
+            default=10,
+            description=(
+                "Consecutive transient failures (5xx, connection errors, "
+                "timeouts) after which an optional child endpoint is not "
+                "requested again during the run. 0 disables"
+            ),
+        ),
+        th.Property(
+            "http_cassette_path",
+            th.StringType,
+            description=(
+                "Path of an HTTP cassette (JSON lines, gzip-compressed when the "
+                "name ends in .gz) to record API traffic to or replay it from"
+            ),
+        ),
+        th.Property(
+            "http_cassette_mode",
+            th.StringType,
+            default="record",
+            allowed_values=["record", "replay"],
+            description=(
+                "Whether to record live API traffic to the cassette or replay "
+                "the cassette without network access"
+            ),
+        ),
+        th.Property(
+            "replay_speed",
+            th.NumberType,
+            default=0,
+            description=(
+                "Replay timing relative to the recording: 1 keeps the original "
+                "latencies, 2 halves them, 0 replays without delays"
+            ),
+        ),
+        th.Property(
+            "parse_processes",
+            th.IntegerType,
+            default=0,
+            description=(
+                "Number of worker processes that decode, conform and serialize "
+                "pages of leaf streams, leaving the main process to do I/O. "
+                "0 parses in-process"
+            ),
+        ),
+        th.Property(
+            "organizations",
+            th.ArrayType(
+                th.ObjectType(
+                    th.Property("org_id", th.StringType, required=True),
+                    th.Property("client_id", th.StringType, required=True, secret=True),
+                    th.Property(
+                        "client_secret", th.StringType, required=True, secret=True
+                    ),
+                    th.Property("api_url", th.StringType, required=True),
+                )
+            ),
+            description=(
+                "Sigma organizations to extract in one run, each with its own "
+                "credentials and API URL. Records carry the `orgId` they came from"
+            ),
+        ),
+        th.Property(
+            "requests_per_minute",
+            th.IntegerType,
+            description=(
+                "Request budget per minute for each organization's API. Unset "
+                "leaves requests unthrottled"
+            ),
+        ),
+        th.Property(
+            "page_read_ahead",
+            th.IntegerType,
+            default=0,
+            description=(
+                "Number of following pages requested while the current page of "
+                "a stream is emitted. 0 requests one page at a time"
+            ),
+        ),
+        th.Property(
+            "connect_timeout_seconds",
+            th.NumberType,
+            default=10,
+            description="Seconds to wait for a connection to the Sigma API",
+        ),
+        th.Property(
+            "read_timeout_seconds",
+            th.NumberType,
+            default=300,
+            description="Seconds to wait for the Sigma API to send response data",
+        ),
+        th.Property(
+            "request_timeouts",
+            th.ArrayType(
+                th.ObjectType(
+                    th.Property("stream", th.StringType, required=True),
+                    th.Property("connect_seconds", th.NumberType),
+                    th.Property("read_seconds", th.NumberType),
+                )
+            ),
+            description=(
+                "Connect and read timeouts overriding the tap-wide ones for the "
+                "endpoint of a stream"
+            ),
+        ),
+        th.Property(
+            "hedge_requests",
+            th.BooleanType,
+            default=False,
+            description=(
+                "Send a duplicate of a GET request that has not answered within "
+                "its stream's observed p95 latency, and use whichever response "
+                "arrives first"
+            ),
+        ),
+        th.Property(
+            "max_hedged_requests",
+            th.IntegerType,
+            default=100,
+            description="Maximum number of duplicate (hedged) requests per run",
+        ),
+        th.Property(
+            "max_runtime_seconds",
+            th.IntegerType,
+            description=(
+                "Seconds after which no new request is sent. In-flight work is "
+                "drained and the final state records the completed contexts, "
+                "which the next run skips"
+            ),
+        ),
+        th.Property(
+            "max_requests",
+            th.IntegerType,
+            description=(
+                "Number of API requests after which the run stops the same way "
+                "as with `max_runtime_seconds`"
+            ),
+        ),
+        th.Property(
+            "max_records_per_stream",
+            th.IntegerType,
+            description=(
+                "Maximum number of records synced per stream. Pagination stops "
+                "as soon as the cap is reached; meant for validation runs"
+            ),
+        ),
+        th.Property(
+            "parent_sample_fraction",
+            th.NumberType,
+            default=1,
+            description=(
+                "Fraction (0-1) of top-level parents (workbooks, datasets, ...) "
+                "whose child streams are synced. The sample is hash-based and "
+                "identical from run to run"
+            ),
+        ),
+        th.Property(
+            "parallel_streams",
+            th.IntegerType,
+            default=1,
+            description=(
+                "Number of top-level stream trees (connections, members, "
+                "datasets, ...) synced at once, per organization. Streams in "
+                "another's `sync_after` still finish first"
+            ),
+        ),
     ).to_dict()
 
+    _resource_lock = threading.Lock()
+    _output_lock = threading.Lock()
+
+    # Held by streams while they update the tap state, and while it is
+    # serialized (see `write_message`)
+    state_lock = threading.RLock()
+    _http_session: Optional[requests.Session] = None
+    _organizations: Optional[Dict[str, Dict[str, Any]]] = None
+    _org_sessions: Optional[Dict[str, requests.Session]] = None
+    _rate_limiters: Optional[Dict[Optional[str], RateLimiter]] = None
+    _parent_cache: Optional[ParentContextCache] = None
+    _worker_pool: Optional[ThreadPoolExecutor] = None
+    _page_pool: Optional[ThreadPoolExecutor] = None
+    _page_futures: Optional[set] = None
+    _hedge_pool: Optional[ThreadPoolExecutor] = None
+    _hedges_sent = 0
+    _sync_started_at: Optional[float] = None
+    _requests_sent = 0
+    _stop_reason: Optional[str] = None
+
+    # Set once a stream context is cut short by the run's budget
+    sync_interrupted = False
+    _member_index: Optional[Dict[str, Tuple[Optional[str], ...]]] = None
+    _parent_versions: Optional[Dict[str, str]] = None
+    _cassette: Optional[Cassette] = None
+    _parse_pool: Optional[ProcessPoolExecutor] = None
+    _lineage: Optional[LineageGraph] = None
+
+    # Resources shared by runs of a long-running server (see `reuse_resources`)
+    _resource_attributes = (
+        "_http_session",
+        "_org_sessions",
+        "_rate_limiters",
+        "_parent_cache",
+        "_worker_pool",
+        "_page_pool",
+        "_page_futures",
+        "_hedge_pool",
+        "_member_index",
+        "_parent_versions",
+        "_cassette",
+        "_parse_pool",
+    )
+
+    # Whether `sync_all` leaves resources open for a following run
+    keep_resources = False
+
+    # Where Singer messages are written; stdout when unset
+    output: Optional[IO[str]] = None
+
+    @property
+    def organizations(self) -> Dict[str, Dict[str, Any]]:
+        """Return the configured organizations, in configured order.
+
+        Returns:
+            Mapping of org_id to organization settings; empty for a single
+            organization configured with top-level credentials.
+        """
+        if self._organizations is None:
+            self._organizations = {
+                organization["org_id"]: organization
+                for organization in self.config.get("organizations") or []
+            }
+        return self._organizations
+
+    def org_session(self, org_id: str) -> requests.Session:
+        """Return the HTTP session (and connection pool) of an organization.
+
+        Args:
+            org_id: Organization ID.
+
+        Returns:
+            The organization's session.
+        """
+        with self._resource_lock:
+            if self._org_sessions is None:
+                self._org_sessions = {}
+            if org_id not in self._org_sessions:
+                self._org_sessions[org_id] = requests.Session()
+            return self._org_sessions[org_id]
+
+    def rate_limiter(self, context: Optional[Dict]) -> Optional[RateLimiter]:
+        """Return the request limiter of a context's organization, if configured.
+
+        Args:
+            context: Stream partition or context dictionary.
+
+        Returns:
+            The limiter, or None when `requests_per_minute` is not set.
+        """
+        requests_per_minute = self.config.get("requests_per_minute")
+        if not requests_per_minute:
+            return None
+
+        org_id = (context or {}).get("orgId")
+        with self._resource_lock:
+            if self._rate_limiters is None:
+                self._rate_limiters = {}
+            if org_id not in self._rate_limiters:
+                self._rate_limiters[org_id] = RateLimiter(requests_per_minute)
+            return self._rate_limiters[org_id]
+
+    @property
+    def parse_pool(self) -> Optional[ProcessPoolExecutor]:
+        """Return the process pool parsing response pages, if enabled.
+
+        Worker processes are spawned rather than forked: the pool is created
+        while page, worker and stream threads are running, and a forked child
+        could inherit locks held by them.
+
+        Returns:
+            The process pool, or None when `parse_processes` is 0.
+        """
+        with self._resource_lock:
+            if self._parse_pool is None and self.config.get("parse_processes"):
+                self._parse_pool = ProcessPoolExecutor(
+                    max_workers=self.config["parse_processes"],
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._parse_pool
+
+    def write_message(self, message: Message) -> None:
+        """Write a message to the tap's output.
+
+        STATE messages hold the whole tap state, so they are serialized under
+        `state_lock`, which streams hold while they update the state: every
+        STATE line is a consistent snapshot, even while other streams sync
+        concurrently.
+
+        Args:
+            message: The message to write.
+        """
+        if isinstance(message, StateMessage):
+            with self.state_lock:
+                line = format_message(message)
+        else:
+            line = format_message(message)
+        self.write_serialized_message(line)
+
+    def write_serialized_message(self, message: str) -> None:
+        """Write a message that was already serialized to the tap's output.
+
+        Messages of concurrently synced streams are written one whole line at
+        a time.
+
+        Args:
+            message: The JSON-encoded Singer message.
+        """
+        output = self.output or sys.stdout
+        with self._output_lock:
+            output.write(message + "\n")
+            output.flush()
+
+    @property
+    def http_session(self) -> requests.Session:
+        """Return the HTTP session (and connection pool) shared by all streams.
+
+        Returns:
+            The tap's session.
+        """
+        with self._resource_lock:
+            if self._http_session is None:
+                self._http_session = requests.Session()
+            return self._http_session
+
+    @property
+    def cassette(self) -> Optional[Cassette]:
+        """Return the HTTP cassette, if configured.
+
+        Returns:
+            The cassette, or None when `http_cassette_path` is not set.
+        """
+        if self._cassette is None and self.config.get("http_cassette_path"):
+            self._cassette = Cassette(
+                self.config["http_cassette_path"],
+                mode=self.config.get("http_cassette_mode", "record"),
+                secrets=[
+                    self.config.get("client_id"),
+                    self.config.get("client_secret"),
+                    *(
+                        organization[key]
+                        for organization in self.organizations.values()
+                        for key in ("client_id", "client_secret")
+                    ),
+                ],
+                replay_speed=self.config.get("replay_speed", 0),
+            )
+        return self._cassette
+
+    @property
+    def parent_versions(self) -> Dict[str, str]:
+        """Return the `updatedAt` of parent records, keyed by child context.
+
+        Returns:
+            Mapping used to invalidate negative cache entries of changed parents.
+        """
+        if self._parent_versions is None:
+            self._parent_versions = {}
+        return self._parent_versions
+
+    @property
+    def worker_pool(self) -> ThreadPoolExecutor:
+        """Return the worker pool shared by all streams for concurrent requests.
+
+        Returns:
+            The tap's thread pool executor.
+        """
+        if self._worker_pool is None:
+            self._worker_pool = ThreadPoolExecutor(
+                max_workers=self.config.get("max_workers", 8),
+                thread_name_prefix="tap-sigma",
+            )
+        return self._worker_pool
+
+    @property
+    def page_pool(self) -> ThreadPoolExecutor:
+        """Return the pool requesting pages read ahead of the one being emitted.
+
+        Kept apart from the worker pool, whose tasks may themselves read ahead.
+
+        Returns:
+            The tap's page thread pool executor.
+        """
+        with self._resource_lock:
+            if self._page_pool is None:
+                self._page_pool = ThreadPoolExecutor(
+                    max_workers=self.config.get("max_workers", 8),
+                    thread_name_prefix="tap-sigma-page",
+                )
+            return self._page_pool
+
+    def submit_page(self, fn: Callable[..., Any], *args: Any) -> Future:
+        """Request a page on the page pool, tracking it until it is done.
+
+        Args:
+            fn: Callable requesting the page.
+            *args: Arguments of the callable.
+
+        Returns:
+            The future of the request.
+        """
+        future = self.page_pool.submit(fn, *args)
+        with self._resource_lock:
+            if self._page_futures is None:
+                self._page_futures = set()
+            page_futures = self._page_futures
+            page_futures.add(future)
+        future.add_done_callback(page_futures.discard)
+        return future
+
+    def count_request(self) -> None:
+        """Count a request against the run's `max_requests` budget."""
+        with self._resource_lock:
+            self._requests_sent += 1
+
+    @property
+    def stop_reason(self) -> Optional[str]:
+        """Return why the run stopped sending requests, if it did.
+
+        Returns:
+            "max_runtime_seconds" or "max_requests" once that budget is spent,
+            otherwise None.
+        """
+        if self._stop_reason is None:
+            max_runtime = self.config.get("max_runtime_seconds")
+            max_requests = self.config.get("max_requests")
+            if (
+                max_runtime
+                and self._sync_started_at is not None
+                and time.monotonic() - self._sync_started_at >= max_runtime
+            ):
+                self._stop_reason = "max_runtime_seconds"
+            elif max_requests and self._requests_sent >= max_requests:
+                self._stop_reason = "max_requests"
+            if self._stop_reason is not None:
+                self.logger.warning(
+                    f"Reached {self._stop_reason}; stopping after in-flight work"
+                )
+        return self._stop_reason
+
+    @property
+    def hedge_pool(self) -> ThreadPoolExecutor:
+        """Return the pool sending hedged requests and their duplicates.
+
+        Returns:
+            The tap's hedging thread pool executor.
+        """
+        with self._resource_lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(
+                    max_workers=self.config.get("max_workers", 8) * 2,
+                    thread_name_prefix="tap-sigma-hedge",
+                )
+            return self._hedge_pool
+
+    def take_hedge(self, context: Optional[Dict]) -> bool:
+        """Take one hedged request from the run's and the org's budgets.
+
+        Args:
+            context: Stream partition or context dictionary of the request.
+
+        Returns:
+            True if a duplicate request may be sent.
+        """
+        with self._resource_lock:
+            if self._hedges_sent >= self.config.get("max_hedged_requests", 100):
+                return False
+            # Reserved before the rate budget is asked, so concurrent requests
+            # can never take more than the cap between them
+            self._hedges_sent += 1
+        rate_limiter = self.rate_limiter(context)
+        if rate_limiter is not None and not rate_limiter.try_acquire():
+            with self._resource_lock:
+                self._hedges_sent -= 1
+            return False
+        return True
+
+    @property
+    def lineage(self) -> Optional[LineageGraph]:
+        """Return the lineage graph collected during the run, if needed.
+
+        Returns:
+            The graph, or None when the `lineage_edges` stream is not selected.
+        """
+        with self._resource_lock:
+            if self._lineage is None:
+                stream = self.streams.get("lineage_edges")
+                if stream is not None and stream.selected:
+                    self._lineage = LineageGraph()
+            return self._lineage
+
+    @property
+    def member_index(self) -> Optional[Dict[str, Tuple[Optional[str], ...]]]:
+        """Return the in-process index of members, if enabled.
+
+        Returns:
+            Mapping of memberId to (email, firstName, lastName), or None when
+            `denormalize_team_members` is disabled.
+        """
+        with self._resource_lock:
+            if self._member_index is None and self.config.get(
+                "denormalize_team_members"
+            ):
+                self._member_index = {}
+                if not self.streams["members"].selected:
+                    # The index is only filled by the members stream
+                    self.logger.warning(
+                        "denormalize_team_members is enabled but 'members' is "
+                        "not synced in this run; team member emails and names "
+                        "are left empty"
+                    )
+        return self._member_index
+
+    @property
+    def parent_cache(self) -> Optional[ParentContextCache]:
+        """Return the parent context cache, if configured.
+
+        Returns:
+            The cache instance, or None when `parent_cache_path` is not set.
+        """
+        if self._parent_cache is None and self.config.get("parent_cache_path"):
+            self._parent_cache = ParentContextCache(
+                self.config["parent_cache_path"],
+                ttl_seconds=self.config.get("parent_cache_ttl_seconds", 86400),
+            )
+        return self._parent_cache
+
+    def _validate_config(self, *, raise_errors: bool = True) -> List[str]:
+        """Validate config, including settings that span several properties.
+
+        Args:
+            raise_errors: Flag to throw an exception if any validation errors are found.
+
+        Returns:
+            A list of validation errors.
+
+        Raises:
+            ConfigValidationError: If raise_errors is True and validation fails.
+        """
+        errors = super()._validate_config(raise_errors=raise_errors)
+        tap_errors = []
+
+        shard_count = self.config.get("shard_count", 1)
+        if shard_count < 1:
+            tap_errors.append("shard_count must be at least 1")
+        elif not 0 <= self.config.get("shard_index", 0) < shard_count:
+            tap_errors.append("shard_index must be between 0 and shard_count - 1")
+
+        if not 0 < self.config.get("parent_sample_fraction", 1) <= 1:
+            tap_errors.append("parent_sample_fraction must be in the range (0, 1]")
+
+        organizations = self.config.get("organizations") or []
+        if organizations:
+            org_ids = [organization.get("org_id") for organization in organizations]
+            if len(set(org_ids)) != len(org_ids):
+                tap_errors.append("organizations must have unique org_id values")
+            if any(
+                "orgId" not in element
+                for element in self.config.get("export_elements") or []
+            ):
+                tap_errors.append(
+                    "export_elements need an orgId when organizations are set"
+                )
+        else:
+            missing = [
+                key
+                for key in ("client_id", "client_secret", "api_url")
+                if not self.config.get(key)
+            ]
+            if missing:
+                tap_errors.append(
+                    f"{', '.join(missing)} required unless organizations are set"
+                )
+
+        if tap_errors and raise_errors:
+            raise ConfigValidationError("Config validation failed", errors=tap_errors)
+        return errors + tap_errors
+
+    @property
+    def is_primary_shard(self) -> bool:
+        """Return whether this process emits top-level streams.
+
+        Returns:
+            True unless this is a secondary shard of a sharded run.
+        """
+        return self.config.get("shard_index", 0) == 0
+
     def discover_streams(self) -> List[Stream]:
         """Return a list of discovered streams.
 
         Only includes streams that are verified working in Sigma API v2.
         Excluded (404/400 errors): account-types, data-models, favorites, whoami, grants
+        The element export stream is only offered when `export_elements` is set.
+        The lineage stream is derived from other streams and sends no requests.
         """
-        return [
+        discovered: List[Stream] = [
             # Top-level streams
             streams.ConnectionsStream(self),
             streams.DatasetsStream(self),
@@ -66,11 +810,358 @@ class TapSigma(Tap):
             streams.DatasetMaterializationsStream(self),
             streams.DatasetGrantsStream(self),
             streams.DatasetSourcesStream(self),
+            # Team child streams
+            streams.TeamMembersStream(self),
             # Workbook child streams
             streams.WorkbookSchedulesStream(self),
             streams.WorkbookMaterializationSchedulesStream(self),
+            streams.WorkbookSourcesStream(self),
             streams.WorkbookPageElementsStream(self),
         ]
+        if self.config.get("export_elements"):
+            discovered.append(streams.WorkbookElementExportsStream(self))
+        # Derived streams, synced after the streams they are built from
+        discovered.append(streams.LineageEdgesStream(self))
+        return discovered
+
+    def _top_level_streams(self) -> List[Stream]:
+        """Return the top-level streams to sync, in sync order.
+
+        With `plan_sync` enabled the streams are ordered by the sync planner,
+        most expensive fan-out first. Either way, streams named in another
+        stream's `sync_after` are synced ahead of it.
+
+        Returns:
+            Selected top-level streams, or parents of selected streams.
+        """
+        top_level_streams = []
+        for stream in self.streams.values():
+            if not stream.selected and not stream.has_selected_descendents:
+                self.logger.info(f"Skipping deselected stream '{stream.name}'.")
+                continue
+            if stream.parent_stream_type is None:
+                top_level_streams.append(stream)
+
+        if not self.config.get("plan_sync"):
+            return dependencies_first(top_level_streams)
+
+        plan = SyncPlanner(self).plan(top_level_streams)
+        for estimate in plan:
+            self.logger.info(
+                f"Planned '{estimate.stream}': ~{estimate.requests} requests "
+                f"({estimate.source})"
+            )
+        return [self.streams[estimate.stream] for estimate in plan]
+
+    def sync_all(self) -> None:
+        """Sync all streams, releasing tap-level resources afterwards."""
+        # The SDK marks Tap.sync_all final, but it syncs top-level streams one
+        # at a time in discovery order and has no hook before or after the
+        # run. It is replaced so that secondary shards leave top-level records
+        # to shard 0, request metrics and resume points reach the final state,
+        # and pooled resources are released. The streams themselves are synced
+        # by the SDK's implementation unless `plan_sync`, `parallel_streams`,
+        # several `organizations` or a `sync_after` change their order.
+        if not self.is_primary_shard:
+            # Top-level streams are emitted by shard 0 only; other shards still
+            # list them (unselected) to fan out to their slice of child streams.
+            for stream in self.streams.values():
+                if stream.parent_stream_type is None and stream.selected:
+                    self.logger.info(
+                        f"Leaving '{stream.name}' to shard 0; syncing its "
+                        "child streams only"
+                    )
+                    stream.selected = False
+        self._sync_started_at = time.monotonic()
+        try:
+            synced = [
+                stream
+                for stream in self.streams.values()
+                if stream.parent_stream_type is None
+                and (stream.selected or stream.has_selected_descendents)
+            ]
+            if (
+                self.config.get("plan_sync")
+                or self.config.get("parallel_streams", 1) > 1
+                or len(self.organizations) > 1
+                or dependencies_first(synced) != synced
+            ):
+                self._sync_ordered()
+            else:
+                super().sync_all()
+
+            # Keep request metrics for planning the next run
+            for stream in self.streams.values():
+                stream.cancel_prefetches()
+                record_sync_metrics(stream)
+                stream.record_resume_point()
+                stream.prune_negative_cache()
+            self.write_message(StateMessage(value=self.state))
+            self._log_sync_outcome()
+        finally:
+            if not self.keep_resources:
+                self.close_resources()
+
+    def _sync_ordered(self) -> None:
+        """Sync top-level streams in planned order, concurrently if enabled.
+
+        Follows the SDK's `Tap.sync_all`, whose state preparation steps are
+        private to the SDK, with the stream loop replaced.
+        """
+        self._reset_state_progress_markers()
+        self._set_compatible_replication_methods()
+        self.write_message(StateMessage(value=self.state))
+
+        top_level_streams = self._top_level_streams()
+        parallel_streams = self.config.get("parallel_streams", 1)
+        if len(self.organizations) > 1:
+            # Every organization syncs its own stream trees
+            self._sync_concurrently(
+                top_level_streams, parallel_streams * len(self.organizations)
+            )
+        elif parallel_streams > 1:
+            self._sync_concurrently(top_level_streams, parallel_streams)
+        else:
+            for stream in top_level_streams:
+                self._sync_tree(stream)
+
+        for stream in self.streams.values():
+            stream.log_sync_costs()
+
+    def _sync_tree(
+        self,
+        stream: Stream,
+        dependencies: Sequence[Future] = (),
+        partition: Optional[Dict] = None,
+    ) -> None:
+        """Sync a top-level stream and its children.
+
+        Args:
+            stream: Top-level stream to sync.
+            dependencies: Syncs of the streams in its `sync_after`, to wait for.
+            partition: Organization partition to sync; all partitions when unset.
+        """
+        for dependency in dependencies:
+            dependency.result()
+        if self.stop_reason is not None:
+            self.sync_interrupted = True
+            return
+        org_id = (partition or {}).get("orgId")
+        try:
+            stream.sync(partition)
+            if partition is None:
+                stream.finalize_state_progress_markers()
+        finally:
+            # Listings prefetched for contexts the tree never reached
+            tree = [stream]
+            while tree:
+                tree_stream = tree.pop()
+                tree.extend(tree_stream.child_streams)
+                tree_stream.cancel_prefetches(org_id)
+
+    def _sync_concurrently(self, streams: List[Stream], max_workers: int) -> None:
+        """Sync independent top-level stream trees on a pool of threads.
+
+        Streams start in the given (planned) order; a stream listed in
+        another's `sync_after` is always started, and finished, first. With
+        several organizations, each organization's trees are synced as tasks
+        of their own, so organizations are synced concurrently and a stream
+        only waits for its dependencies in the same organization. Messages
+        are interleaved line by line by `write_message`.
+
+        Args:
+            streams: Top-level streams to sync, in sync order.
+            max_workers: Number of stream trees synced at once.
+        """
+        ordered: List[Stream] = []
+
+        def add(stream: Stream) -> None:
+            if stream in ordered:
+                return
+            for name in getattr(stream, "sync_after", ()):
+                dependency = next((s for s in streams if s.name == name), None)
+                if dependency is not None:
+                    add(dependency)
+            ordered.append(stream)
+
+        for stream in streams:
+            add(stream)
+
+        partitions: List[Optional[Dict]] = [None]
+        if len(self.organizations) > 1:
+            partitions = [{"orgId": org_id} for org_id in self.organizations]
+            for stream in ordered:
+                # Create the partitions' state in org order, before any sync
+                for partition in partitions:
+                    stream.get_context_state(partition)
+
+        futures: Dict[Tuple[str, Optional[str]], Future] = {}
+        with ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="tap-sigma-stream"
+        ) as executor:
+            # Dependencies are submitted first, so a stream waiting for them
+            # never holds back one that has not started yet
+            for stream in ordered:
+                for partition in partitions:
+                    org_id = (partition or {}).get("orgId")
+                    dependencies = [
+                        futures[(name, org_id)]
+                        for name in getattr(stream, "sync_after", ())
+                        if (name, org_id) in futures
+                    ]
+                    futures[(stream.name, org_id)] = executor.submit(
+                        self._sync_tree, stream, dependencies, partition
+                    )
+            for future in futures.values():
+                future.result()
+
+        if partitions != [None]:
+            for stream in ordered:
+                stream.finalize_state_progress_markers()
+
+    def reuse_resources(self, other: "TapSigma") -> None:
+        """Take over the warm resources of another tap instance.
+
+        Used by the long-running server so that every run shares the same
+        HTTP connection pools, rate budgets, worker pools and caches.
+
+        Args:
+            other: A tap whose sync kept its resources open.
+        """
+        for attribute in self._resource_attributes:
+            setattr(self, attribute, getattr(other, attribute))
+
+    def close_resources(self) -> None:
+        """Release tap-level resources: caches, pools, sessions and cassette."""
+        if self._worker_pool is not None:
+            self._worker_pool.shutdown(wait=True)
+            self._worker_pool = None
+        # Closed after the worker pool, which runs stale listing refreshes
+        if self._parent_cache is not None:
+            self._parent_cache.close()
+            self._parent_cache = None
+        if self._page_pool is not None:
+            # Pages read ahead that no stream will consume are not requested
+            for future in list(self._page_futures or ()):
+                future.cancel()
+            self._page_pool.shutdown(wait=True)
+            self._page_pool = None
+            self._page_futures = None
+        if self._hedge_pool is not None:
+            # Don't wait for requests that lost a hedging race
+            self._hedge_pool.shutdown(wait=False)
+            self._hedge_pool = None
+        if self._cassette is not None:
+            self._cassette.close()
+            self._cassette = None
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(wait=True)
+            self._parse_pool = None
+        for session in (self._org_sessions or {}).values():
+            session.close()
+        self._org_sessions = None
+        if self._http_session is not None:
+            self._http_session.close()
+            self._http_session = None
+
+    def _log_sync_outcome(self) -> None:
+        """Log the run's duration, request count and stop reason as a metric.
+
+        A run in which a stream's circuit breaker tripped is reported as
+        "degraded", with the streams whose endpoint was abandoned.
+        """
+        open_circuits = [
+            stream.name for stream in self.streams.values() if stream.circuit_open
+        ]
+        status = "succeeded"
+        if self.stop_reason is not None:
+            status = "stopped"
+        elif open_circuits:
+            status = "degraded"
+        tags = {
+            metrics.Tag.JOB_TYPE: "sync",
+            metrics.Tag.STATUS: status,
+            "requests": self._requests_sent,
+        }
+        if self.stop_reason is not None:
+            tags["stop_reason"] = self.stop_reason
+        if open_circuits:
+            tags["open_circuits"] = open_circuits
+        metrics.log(
+            self.metrics_logger,
+            metrics.Point(
+                "timer",
+                metrics.Metric.JOB_DURATION,
+                time.monotonic() - self._sync_started_at,
+                tags,
+            ),
+        )
+
+    def run_plan(self) -> List[StreamEstimate]:
+        """Print the estimated request budget of each selected stream as JSON.
+
+        Returns:
+            The planned stream estimates, in sync order.
+        """
+        plan = SyncPlanner(self).plan(
+            [
+                stream
+                for stream in self.streams.values()
+                if stream.parent_stream_type is None
+                and (stream.selected or stream.has_selected_descendents)
+            ]
+        )
+        print(
+            json.dumps(
+                {
+                    "streams": [estimate._asdict() for estimate in plan],
+                    "total_requests": sum(estimate.requests for estimate in plan),
+                },
+                indent=2,
+            )
+        )
+        return plan
+
+    @classmethod
+    def invoke(cls, *, plan: bool = False, **kwargs: Any) -> None:
+        """Invoke the tap's command line interface.
+
+        Args:
+            plan: Print the estimated request budget per stream instead of syncing.
+            **kwargs: Arguments handled by the SDK's tap CLI.
+        """
+        if not plan:
+            super().invoke(**kwargs)
+            return
+
+        config_files, parse_env_config = cls.config_from_cli_args(
+            *kwargs.get("config", ())
+        )
+        tap = cls(
+            config=config_files,
+            state=kwargs.get("state"),
+            catalog=kwargs.get("catalog"),
+            parse_env_config=parse_env_config,
+            validate_config=True,
+        )
+        tap.run_plan()
+
+    @classmethod
+    def get_singer_command(cls) -> click.Command:
+        """Return the tap's CLI command, adding the `--plan` option.
+
+        Returns:
+            A click.Command object.
+        """
+        command = super().get_singer_command()
+        command.params.append(
+            click.Option(
+                ["--plan"],
+                is_flag=True,
+                help="Print the estimated request budget per stream and exit.",
+            )
+        )
+        return command
 
 
 if __name__ == "__main__":
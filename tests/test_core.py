@@ -1,8 +1,24 @@
 """Tests for tap-sigma core functionality."""
 
+import gzip
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qsl, urlparse
+
 import pytest
+import requests
+from singer_sdk import metrics
+from singer_sdk.exceptions import ConfigValidationError, FatalAPIError
 from singer_sdk.testing import get_tap_test_class
 
+from tap_sigma.auth import SigmaAuthenticator
+from tap_sigma.cache import ParentContextCache
+from tap_sigma.client import SigmaPaginator, SigmaStream
+from tap_sigma.serve import SyncServer
 from tap_sigma.tap import TapSigma
 
 # Configuration for testing
@@ -12,11 +28,18 @@ SAMPLE_CONFIG = {
     "api_url": "https://aws-api.sigmacomputing.com",
 }
 
+# Replays recorded API traffic so the SDK's standard tests run offline
+REPLAY_CONFIG = {
+    **SAMPLE_CONFIG,
+    "http_cassette_path": str(Path(__file__).parent / "fixtures" / "sigma.cassette.jsonl"),
+    "http_cassette_mode": "replay",
+}
+
 
 # Run standard tap tests from the SDK
 TestTapSigma = get_tap_test_class(
     tap_class=TapSigma,
-    config=SAMPLE_CONFIG,
+    config=REPLAY_CONFIG,
 )
 
 
@@ -62,3 +85,1108 @@ class TestTapSigmaCustom:
         with pytest.raises(Exception):
             # Should fail without required config
             TapSigma(config={})
+
+
+def _json_response(request, payload, status_code=200):
+    """Build a fake API response for a prepared request."""
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(payload).encode()
+    response.raw = io.BytesIO(response._content)
+    response.headers["Content-Type"] = "application/json"
+    response.url = request.url
+    response.request = request
+    return response
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    """Route HTTP requests to in-memory payloads keyed by URL path.
+
+    Routes keyed by host and path (e.g. "a.example.com/v2/workbooks") take
+    precedence over routes keyed by path only.
+    """
+    routes = {}
+    calls = []
+
+    def send(session, request, **kwargs):
+        url = urlparse(request.url)
+        path = url.path
+        if url.netloc + path in routes:
+            path = url.netloc + path
+        calls.append(path)
+        if path not in routes:
+            return _json_response(request, {"message": "not found"}, 404)
+        if callable(routes[path]):
+            return routes[path](request)
+        return _json_response(request, routes[path])
+
+    monkeypatch.setattr(requests.Session, "send", send)
+    monkeypatch.setattr(SigmaStream, "_shared_authenticator", None)
+    monkeypatch.setattr(SigmaStream, "_org_authenticators", {})
+    monkeypatch.setattr(SigmaAuthenticator, "is_token_valid", True)
+    monkeypatch.setattr(SigmaAuthenticator, "access_token", "token", raising=False)
+    return routes, calls
+
+
+def _select_only(tap, *names):
+    """Select only the named streams of a tap."""
+    for stream in tap.streams.values():
+        stream.selected = stream.name in names
+
+
+def _records(capsys, stream=None):
+    """Return the RECORD messages written so far, optionally for one stream."""
+    messages = [
+        json.loads(line)
+        for line in capsys.readouterr().out.splitlines()
+        if '"RECORD"' in line
+    ]
+    return [m for m in messages if stream is None or m["stream"] == stream]
+
+
+class TestParentContextCache:
+    """Tests for the parent context cache."""
+
+    def test_child_only_sync_uses_cached_parents(self, fake_api, tmp_path, capsys):
+        """Test that a child-only sync fans out from cached parent contexts."""
+        routes, calls = fake_api
+        routes["/v2/workbooks"] = {"entries": [{"workbookId": "wb1"}]}
+        routes["/v2/workbooks/wb1/pages"] = {"entries": [{"pageId": "p1"}]}
+        config = {**SAMPLE_CONFIG, "parent_cache_path": str(tmp_path / "cache.db")}
+
+        for _ in range(2):
+            tap = TapSigma(config=config)
+            _select_only(tap, "workbook_pages")
+            tap.sync_all()
+
+        assert calls.count("/v2/workbooks") == 1
+        assert calls.count("/v2/workbooks/wb1/pages") == 2
+        records = _records(capsys)
+        assert [r["record"]["pageId"] for r in records] == ["p1", "p1"]
+
+    def test_listings_are_stored_and_served_in_batches(self, tmp_path):
+        """Test that listings round-trip row by row, even when replaced mid-read."""
+        cache = ParentContextCache(str(tmp_path / "cache.db"))
+        contexts = [{"workbookId": f"wb{i}"} for i in range(1201)]
+        cache.put("workbooks", None, iter(contexts))
+
+        cached = cache.get("workbooks", None)
+        assert cached.count == 1201
+        served = [next(cached.contexts)]
+        cache.put("workbooks", None, [{"workbookId": "new"}])
+        served.extend(cached.contexts)
+        assert served == contexts
+        assert list(cache.get("workbooks", None).contexts) == [{"workbookId": "new"}]
+
+        with cache.write_listing("workbooks", None) as listing:
+            listing.add({"workbookId": "partial"})
+        assert list(cache.get("workbooks", None).contexts) == [{"workbookId": "new"}]
+        cache.close()
+
+    def test_stale_listings_refresh_concurrently(self, fake_api, tmp_path, capsys):
+        """Test that stale parent listings are re-listed side by side."""
+        routes, calls = fake_api
+        workbook_ids = [f"wb{i}" for i in range(4)]
+        routes["/v2/workbooks"] = {
+            "entries": [{"workbookId": workbook_id} for workbook_id in workbook_ids]
+        }
+        for workbook_id in workbook_ids:
+            routes[f"/v2/workbooks/{workbook_id}/pages"] = {
+                "entries": [{"pageId": "p1"}]
+            }
+            routes[f"/v2/workbooks/{workbook_id}/pages/p1/elements"] = {"entries": []}
+        config = {
+            **SAMPLE_CONFIG,
+            "parent_cache_path": str(tmp_path / "cache.db"),
+            "parent_cache_ttl_seconds": 0,
+        }
+        tap = TapSigma(config=config)
+        _select_only(tap, "workbook_page_elements")
+        tap.sync_all()
+
+        # Every refresh waits for another one, so they only finish side by side
+        refreshes = threading.Barrier(2, timeout=5)
+
+        def pages(request):
+            refreshes.wait()
+            return _json_response(request, {"entries": [{"pageId": "p1"}]})
+
+        for workbook_id in workbook_ids:
+            routes[f"/v2/workbooks/{workbook_id}/pages"] = pages
+        calls.clear()
+        time.sleep(0.01)
+        tap = TapSigma(config=config)
+        _select_only(tap, "workbook_page_elements")
+        tap.sync_all()
+
+        assert sum(path.endswith("/pages") for path in calls) == 4
+        assert not refreshes.broken
+        cache = ParentContextCache(config["parent_cache_path"])
+        for workbook_id in workbook_ids:
+            cached = cache.get("workbook_pages", {"workbookId": workbook_id})
+            assert time.time() - cached.fetched_at < 5
+        cache.close()
+
+
+class TestSharding:
+    """Tests for sharding child stream work across tap processes."""
+
+    def test_shards_partition_child_contexts(self, fake_api, capsys):
+        """Test that shards sync disjoint child slices and one emits parents."""
+        routes, _ = fake_api
+        workbook_ids = [f"wb{i}" for i in range(20)]
+        routes["/v2/workbooks"] = {
+            "entries": [{"workbookId": wb_id} for wb_id in workbook_ids]
+        }
+        for wb_id in workbook_ids:
+            routes[f"/v2/workbooks/{wb_id}/pages"] = {
+                "entries": [{"pageId": "p1"}]
+            }
+
+        pages_by_shard = []
+        workbooks_by_shard = []
+        for shard_index in range(3):
+            tap = TapSigma(
+                config={**SAMPLE_CONFIG, "shard_index": shard_index, "shard_count": 3}
+            )
+            _select_only(tap, "workbooks", "workbook_pages")
+            tap.sync_all()
+            records = _records(capsys)
+            pages_by_shard.append(
+                {
+                    r["record"]["workbookId"]
+                    for r in records
+                    if r["stream"] == "workbook_pages"
+                }
+            )
+            workbooks_by_shard.append(
+                [r for r in records if r["stream"] == "workbooks"]
+            )
+
+        assert sorted(wb for pages in pages_by_shard for wb in pages) == sorted(
+            workbook_ids
+        )
+        assert len(workbooks_by_shard[0]) == 20
+        assert workbooks_by_shard[1] == workbooks_by_shard[2] == []
+
+    def test_invalid_shard_index(self):
+        """Test that a shard index outside shard_count is rejected."""
+        with pytest.raises(Exception):
+            TapSigma(config={**SAMPLE_CONFIG, "shard_index": 2, "shard_count": 2})
+
+
+class TestWorkbookElementExports:
+    """Tests for the workbook element export stream."""
+
+    def test_exports_stream_rows_in_configured_order(self, fake_api, capsys):
+        """Test that configured element exports are streamed into records."""
+        routes, calls = fake_api
+        polls = {"q-e1": 0}
+
+        def submit(request):
+            element_id = json.loads(request.body)["elementId"]
+            return _json_response(request, {"queryId": f"q-{element_id}"})
+
+        def download(request):
+            query_id = urlparse(request.url).path.split("/")[3]
+            if query_id in polls and polls[query_id] == 0:
+                polls[query_id] += 1
+                return _json_response(request, {}, 204)
+            response = _json_response(request, {})
+            response.raw = io.BytesIO(f"id,name\n1,{query_id}\n2,x\n".encode())
+            return response
+
+        routes["/v2/workbooks/wb1/export"] = submit
+        routes["/v2/query/q-e1/download"] = download
+        routes["/v2/query/q-e2/download"] = download
+        config = {
+            **SAMPLE_CONFIG,
+            "export_elements": [
+                {"workbookId": "wb1", "elementId": "e1"},
+                {"workbookId": "wb1", "elementId": "e2"},
+            ],
+            "export_poll_interval_seconds": 0,
+        }
+
+        tap = TapSigma(config=config)
+        _select_only(tap, "workbook_element_exports")
+        tap.sync_all()
+
+        records = [m["record"] for m in _records(capsys)]
+        assert [(r["elementId"], r["rowIndex"], r["row"]) for r in records] == [
+            ("e1", 0, {"id": "1", "name": "q-e1"}),
+            ("e1", 1, {"id": "2", "name": "x"}),
+            ("e2", 0, {"id": "1", "name": "q-e2"}),
+            ("e2", 1, {"id": "2", "name": "x"}),
+        ]
+        assert calls.count("/v2/query/q-e1/download") == 2
+
+    def test_polls_stop_at_the_request_budget(self, fake_api):
+        """Test that export polls count toward `max_requests` and stop there."""
+        routes, calls = fake_api
+        routes["/v2/workbooks/wb1/export"] = {"queryId": "q-e1"}
+        routes["/v2/query/q-e1/download"] = lambda request: _json_response(
+            request, {}, 204
+        )
+        config = {
+            **SAMPLE_CONFIG,
+            "export_elements": [
+                {"workbookId": "wb1", "elementId": "e1"},
+                {"workbookId": "wb1", "elementId": "e2"},
+            ],
+            "export_max_in_flight": 1,
+            "export_poll_interval_seconds": 0,
+            "max_requests": 4,
+        }
+
+        tap = TapSigma(config=config)
+        _select_only(tap, "workbook_element_exports")
+        tap.sync_all()
+
+        assert calls == ["/v2/workbooks/wb1/export"] + ["/v2/query/q-e1/download"] * 3
+        assert tap.sync_interrupted
+
+
+class TestTeamMembers:
+    """Tests for the team members stream."""
+
+    def test_memberships_are_denormalized_from_members(self, fake_api, capsys):
+        """Test that team members are fetched per team and enriched from members."""
+        routes, calls = fake_api
+        routes["/v2/members"] = {
+            "entries": [
+                {"memberId": "m1", "email": "a@example.com", "firstName": "A"},
+                {"memberId": "m2", "email": "b@example.com", "firstName": "B"},
+            ]
+        }
+        routes["/v2/teams"] = {"entries": [{"teamId": f"t{i}"} for i in range(5)]}
+        for i in range(5):
+            routes[f"/v2/teams/t{i}/members"] = {
+                "entries": [{"memberId": "m1"}, {"memberId": "m2"}]
+            }
+
+        tap = TapSigma(config={**SAMPLE_CONFIG, "denormalize_team_members": True})
+        _select_only(tap, "members", "team_members")
+        tap.sync_all()
+
+        records = [m["record"] for m in _records(capsys, "team_members")]
+        assert len(records) == 10
+        assert [r["teamId"] for r in records[:2]] == ["t0", "t0"]
+        assert {r["email"] for r in records} == {"a@example.com", "b@example.com"}
+        assert sum(path.endswith("/members") for path in calls) == 6
+
+    def test_denormalizing_without_members_warns(self, fake_api, caplog):
+        """Test that denormalizing without the members stream is reported."""
+        routes, _ = fake_api
+        routes["/v2/teams"] = {"entries": [{"teamId": "t0"}]}
+        routes["/v2/teams/t0/members"] = {"entries": [{"memberId": "m1"}]}
+
+        tap = TapSigma(config={**SAMPLE_CONFIG, "denormalize_team_members": True})
+        _select_only(tap, "team_members")
+        tap.logger.addHandler(caplog.handler)
+        try:
+            tap.sync_all()
+        finally:
+            tap.logger.removeHandler(caplog.handler)
+
+        assert "'members' is not synced in this run" in caplog.text
+
+    def test_prefetched_memberships_respect_record_cap(self, fake_api, capsys):
+        """Test that prefetched memberships stop at the cap and are cancelled."""
+        routes, calls = fake_api
+        routes["/v2/teams"] = {"entries": [{"teamId": f"t{i}"} for i in range(5)]}
+        for i in range(5):
+            routes[f"/v2/teams/t{i}/members"] = {
+                "entries": [{"memberId": "m1"}, {"memberId": "m2"}]
+            }
+
+        tap = TapSigma(config={**SAMPLE_CONFIG, "max_records_per_stream": 3})
+        _select_only(tap, "team_members")
+        tap.sync_all()
+
+        records = _records(capsys, "team_members")
+        assert len(records) == 3
+        assert tap.streams["team_members"]._prefetched == {}
+
+
+class TestSyncPlanner:
+    """Tests for the cost-based sync planner."""
+
+    def test_plan_uses_previous_run_metrics(self, fake_api, capsys):
+        """Test that stream trees are ordered by the previous run's request costs."""
+        routes, _ = fake_api
+        routes["/v2/tags"] = {"entries": [{"tagId": "t1"}]}
+        routes["/v2/workbooks"] = {
+            "entries": [{"workbookId": "wb1"}, {"workbookId": "wb2"}]
+        }
+        routes["/v2/workbooks/wb1/pages"] = {"entries": [{"pageId": "p1"}]}
+        routes["/v2/workbooks/wb2/pages"] = {"entries": [{"pageId": "p1"}]}
+
+        tap = TapSigma(config=SAMPLE_CONFIG)
+        _select_only(tap, "tags", "workbooks", "workbook_pages")
+        tap.sync_all()
+        capsys.readouterr()
+
+        tap = TapSigma(config=SAMPLE_CONFIG, state=tap.state)
+        _select_only(tap, "tags", "workbooks", "workbook_pages")
+        plan = tap.run_plan()
+
+        assert [tuple(estimate) for estimate in plan] == [
+            ("workbooks", 3, "history"),
+            ("tags", 1, "history"),
+        ]
+        assert json.loads(capsys.readouterr().out)["total_requests"] == 4
+
+    def test_derived_and_export_streams_are_not_probed(self, fake_api, capsys):
+        """Test that only streams sized by listing them are probed."""
+        routes, calls = fake_api
+        routes["/v2/tags"] = {"entries": [{"tagId": "t1"}]}
+        config = {
+            **SAMPLE_CONFIG,
+            "export_elements": [{"workbookId": "wb1", "elementId": "e1"}],
+        }
+
+        tap = TapSigma(config=config)
+        _select_only(tap, "tags", "lineage_edges", "workbook_element_exports")
+        plan = tap.run_plan()
+
+        assert calls == ["/v2/tags"]
+        assert sorted(tuple(estimate) for estimate in plan) == [
+            ("lineage_edges", 0, "config"),
+            ("tags", 1, "probe"),
+            ("workbook_element_exports", 2, "config"),
+        ]
+
+
+class TestNegativeCache:
+    """Tests for the negative-result cache and circuit breaker."""
+
+    def test_empty_parents_are_skipped_until_updated(self, fake_api, capsys):
+        """Test that known-404 parents are skipped until their updatedAt changes."""
+        routes, calls = fake_api
+        routes["/v2/datasets"] = {
+            "entries": [
+                {"datasetId": "d1", "updatedAt": "2024-01-01T00:00:00Z"},
+                {"datasetId": "d2", "updatedAt": "2024-01-01T00:00:00Z"},
+            ]
+        }
+        routes["/v2/datasets/d2/materialization"] = {"status": "ready"}
+
+        state = {}
+        for _ in range(2):
+            tap = TapSigma(config=SAMPLE_CONFIG, state=state)
+            _select_only(tap, "dataset_materializations")
+            tap.sync_all()
+            state = tap.state
+        assert calls.count("/v2/datasets/d1/materialization") == 1
+        assert calls.count("/v2/datasets/d2/materialization") == 2
+
+        routes["/v2/datasets"]["entries"][0]["updatedAt"] = "2024-02-01T00:00:00Z"
+        tap = TapSigma(config=SAMPLE_CONFIG, state=state)
+        _select_only(tap, "dataset_materializations")
+        tap.sync_all()
+        assert calls.count("/v2/datasets/d1/materialization") == 2
+
+    def test_cached_parents_keep_their_version(self, fake_api, tmp_path, capsys):
+        """Test that parents served from the parent cache still invalidate entries."""
+        routes, calls = fake_api
+        routes["/v2/datasets"] = {
+            "entries": [{"datasetId": "d1", "updatedAt": "2024-01-01T00:00:00Z"}]
+        }
+        config = {
+            **SAMPLE_CONFIG,
+            "parent_cache_path": str(tmp_path / "cache.db"),
+            "parent_cache_ttl_seconds": 0,
+        }
+
+        state = {}
+        for updated_at in (None, None, "2024-02-01T00:00:00Z", None):
+            if updated_at:
+                routes["/v2/datasets"]["entries"][0]["updatedAt"] = updated_at
+            tap = TapSigma(config=config, state=state)
+            _select_only(tap, "dataset_materializations")
+            tap.sync_all()
+            state = tap.state
+
+        # Runs 2-4 are served from the stale cache and refresh it in the
+        # background; run 4 sees the updatedAt listed by run 3's refresh
+        assert calls.count("/v2/datasets") == 4
+        assert calls.count("/v2/datasets/d1/materialization") == 2
+
+    def test_circuit_breaker_stops_failing_endpoint(
+        self, fake_api, monkeypatch, capsys
+    ):
+        """Test that an endpoint is abandoned after consecutive server errors."""
+        routes, calls = fake_api
+        monkeypatch.setattr(SigmaStream, "backoff_max_tries", lambda self: 1)
+        routes["/v2/workbooks"] = {
+            "entries": [{"workbookId": f"wb{i}"} for i in range(10)]
+        }
+        for i in range(10):
+            routes[f"/v2/workbooks/wb{i}/schedules"] = lambda request: _json_response(
+                request, {"message": "unavailable"}, 503
+            )
+
+        points = []
+        monkeypatch.setattr(metrics, "log", lambda logger, point: points.append(point))
+
+        tap = TapSigma(config={**SAMPLE_CONFIG, "circuit_breaker_threshold": 3})
+        _select_only(tap, "workbook_schedules")
+        tap.sync_all()
+
+        assert sum(path.endswith("/schedules") for path in calls) == 3
+        outcome = next(p for p in points if p.metric == metrics.Metric.JOB_DURATION)
+        assert outcome.tags[metrics.Tag.STATUS] == "degraded"
+        assert outcome.tags["open_circuits"] == ["workbook_schedules"]
+
+    def test_breaker_is_tripped_per_organization(self, fake_api, monkeypatch):
+        """Test that one organization's outage does not skip another's parents."""
+        routes, calls = fake_api
+        monkeypatch.setattr(SigmaStream, "backoff_max_tries", lambda self: 1)
+        for org in ("a", "b"):
+            routes[f"{org}.example.com/v2/workbooks"] = {
+                "entries": [{"workbookId": f"wb{i}"} for i in range(5)]
+            }
+            for i in range(5):
+                routes[f"{org}.example.com/v2/workbooks/wb{i}/schedules"] = {
+                    "entries": [{"scheduleId": "s1"}]
+                }
+        for i in range(5):
+            routes[f"a.example.com/v2/workbooks/wb{i}/schedules"] = (
+                lambda request: _json_response(request, {"message": "down"}, 503)
+            )
+        config = {
+            "organizations": [
+                {
+                    "org_id": org,
+                    "client_id": f"{org}-id",
+                    "client_secret": f"{org}-secret",
+                    "api_url": f"https://{org}.example.com",
+                }
+                for org in ("a", "b")
+            ],
+            "circuit_breaker_threshold": 2,
+        }
+
+        tap = TapSigma(config=config)
+        _select_only(tap, "workbook_schedules")
+        tap.sync_all()
+
+        schedules = [path[0] for path in calls if path.endswith("/schedules")]
+        assert (schedules.count("a"), schedules.count("b")) == (2, 5)
+        assert tap.streams["workbook_schedules"].circuit_open
+
+    def test_expired_entries_are_pruned_at_end_of_run(self, fake_api, capsys):
+        """Test that entries of parents that are gone do not stay in state."""
+        routes, _ = fake_api
+        routes["/v2/datasets"] = {"entries": []}
+        state = {
+            "bookmarks": {
+                "dataset_materializations": {
+                    "negative_cache": {
+                        "/v2/datasets/gone/materialization": {"cachedAt": 0},
+                        "/v2/datasets/new/materialization": {
+                            "cachedAt": time.time()
+                        },
+                    }
+                }
+            }
+        }
+
+        tap = TapSigma(config=SAMPLE_CONFIG, state=state)
+        _select_only(tap, "dataset_materializations")
+        tap.sync_all()
+
+        bookmark = tap.state["bookmarks"]["dataset_materializations"]
+        assert list(bookmark["negative_cache"]) == ["/v2/datasets/new/materialization"]
+
+    def test_auth_failures_are_not_skipped(self, fake_api, capsys):
+        """Test that a 403 on an optional endpoint fails the sync."""
+        routes, calls = fake_api
+        routes["/v2/workbooks"] = {"entries": [{"workbookId": "wb0"}]}
+        routes["/v2/workbooks/wb0/schedules"] = lambda request: _json_response(
+            request, {"message": "forbidden"}, 403
+        )
+
+        tap = TapSigma(config=SAMPLE_CONFIG)
+        _select_only(tap, "workbook_schedules")
+        with pytest.raises(FatalAPIError):
+            tap.sync_all()
+
+
+class TestCassette:
+    """Tests for HTTP record/replay."""
+
+    def test_recorded_sync_replays_offline(self, fake_api, tmp_path, capsys):
+        """Test that a recorded sync replays the same records without network."""
+        routes, calls = fake_api
+        routes["/v2/tags"] = {
+            "entries": [{"tagId": "t1", "name": "test-client-secret leaked"}]
+        }
+        cassette_path = str(tmp_path / "sync.cassette.jsonl.gz")
+        config = {**SAMPLE_CONFIG, "http_cassette_path": cassette_path}
+
+        tap = TapSigma(config=config)
+        _select_only(tap, "tags")
+        tap.sync_all()
+        recorded = [m["record"] for m in _records(capsys)]
+
+        with gzip.open(cassette_path, "rt") as cassette_file:
+            cassette_text = cassette_file.read()
+        assert "test-client-secret" not in cassette_text
+        assert "Bearer" not in cassette_text
+
+        tap = TapSigma(config={**config, "http_cassette_mode": "replay"})
+        _select_only(tap, "tags")
+        tap.sync_all()
+        replayed = [m["record"] for m in _records(capsys)]
+
+        assert calls == ["/v2/tags"]
+        assert replayed == [{**recorded[0], "name": "<redacted> leaked"}]
+
+
+class TestParseProcesses:
+    """Tests for offloading page parsing to worker processes."""
+
+    def test_offloaded_parsing_matches_in_process(self, capsys):
+        """Test that worker processes emit the same records as in-process parsing."""
+        outputs = []
+        for parse_processes in (0, 2):
+            tap = TapSigma(config={**REPLAY_CONFIG, "parse_processes": parse_processes})
+            _select_only(tap, "workbooks", "workbook_pages", "workbook_page_elements")
+            tap.sync_all()
+            records = _records(capsys)
+            for message in records:
+                message.pop("time_extracted")
+            outputs.append(records)
+
+        assert outputs[0] == outputs[1]
+        assert any(r["stream"] == "workbook_page_elements" for r in outputs[1])
+
+    def test_pages_parsed_concurrently_keep_their_order(
+        self, fake_api, monkeypatch, capsys
+    ):
+        """Test that pages parsed by several processes are emitted in order."""
+        routes, calls = fake_api
+
+        def has_more(paginator, response):
+            raise AssertionError("Page decoded in the main process")
+
+        # Pagination ends on the record counts the worker processes return
+        monkeypatch.setattr(SigmaPaginator, "has_more", has_more)
+        tag_ids = [f"tag{i:03d}" for i in range(450)]
+
+        def list_tags(request):
+            params = dict(parse_qsl(urlparse(request.url).query))
+            offset, limit = int(params["offset"]), int(params["limit"])
+            entries = [{"tagId": tag_id} for tag_id in tag_ids]
+            return _json_response(request, {"entries": entries[offset : offset + limit]})
+
+        routes["/v2/tags"] = list_tags
+        tap = TapSigma(config={**SAMPLE_CONFIG, "parse_processes": 2})
+        _select_only(tap, "tags")
+        tap.sync_all()
+
+        records = _records(capsys)
+        assert [r["record"]["tagId"] for r in records] == tag_ids
+        assert calls.count("/v2/tags") == 5
+
+
+class TestOrganizations:
+    """Tests for extracting several organizations in one run."""
+
+    def test_records_and_state_are_partitioned_by_org(self, fake_api, capsys):
+        """Test that each org is listed on its own host and tagged with orgId."""
+        routes, calls = fake_api
+        for org in ("a", "b"):
+            routes[f"{org}.example.com/v2/workbooks"] = {
+                "entries": [{"workbookId": f"{org}-wb"}]
+            }
+            routes[f"{org}.example.com/v2/workbooks/{org}-wb/pages"] = {
+                "entries": [{"pageId": f"{org}-p"}]
+            }
+        config = {
+            "organizations": [
+                {
+                    "org_id": org,
+                    "client_id": f"{org}-id",
+                    "client_secret": f"{org}-secret",
+                    "api_url": f"https://{org}.example.com",
+                }
+                for org in ("a", "b")
+            ],
+        }
+
+        tap = TapSigma(config=config)
+        _select_only(tap, "workbooks", "workbook_pages")
+        tap.sync_all()
+
+        pages = [
+            (r["record"]["orgId"], r["record"]["pageId"])
+            for r in _records(capsys, "workbook_pages")
+        ]
+        assert sorted(pages) == [("a", "a-p"), ("b", "b-p")]
+        assert tap.streams["workbooks"].primary_keys[0] == "orgId"
+        partitions = tap.state["bookmarks"]["workbooks"]["partitions"]
+        assert [p["context"] for p in partitions] == [{"orgId": "a"}, {"orgId": "b"}]
+        assert "a.example.com/v2/workbooks" in calls
+        assert "b.example.com/v2/workbooks" in calls
+
+    def test_organizations_sync_concurrently(self, fake_api, capsys):
+        """Test that one organization's trees do not wait for another's."""
+        routes, _ = fake_api
+        b_listed = threading.Event()
+
+        def list_a_pages(request):
+            # Only answers once org b's child stream was listed in the meantime
+            assert b_listed.wait(5)
+            return _json_response(request, {"entries": [{"pageId": "a-p"}]})
+
+        def list_b_pages(request):
+            b_listed.set()
+            return _json_response(request, {"entries": [{"pageId": "b-p"}]})
+
+        for org in ("a", "b"):
+            routes[f"{org}.example.com/v2/workbooks"] = {
+                "entries": [{"workbookId": f"{org}-wb"}]
+            }
+        routes["a.example.com/v2/workbooks/a-wb/pages"] = list_a_pages
+        routes["b.example.com/v2/workbooks/b-wb/pages"] = list_b_pages
+        config = {
+            "organizations": [
+                {
+                    "org_id": org,
+                    "client_id": f"{org}-id",
+                    "client_secret": f"{org}-secret",
+                    "api_url": f"https://{org}.example.com",
+                }
+                for org in ("a", "b")
+            ],
+        }
+
+        tap = TapSigma(config=config)
+        _select_only(tap, "workbook_pages")
+        tap.sync_all()
+
+        records = [m["record"] for m in _records(capsys)]
+        assert sorted(r["pageId"] for r in records) == ["a-p", "b-p"]
+        partitions = tap.state["bookmarks"]["workbooks"]["partitions"]
+        assert [p["context"] for p in partitions] == [{"orgId": "a"}, {"orgId": "b"}]
+
+    def test_credentials_required_without_organizations(self):
+        """Test that config needs top-level credentials or organizations."""
+        with pytest.raises(ConfigValidationError):
+            TapSigma(config={"api_url": "https://api.example.com"})
+
+
+class TestPageReadAhead:
+    """Tests for requesting pages ahead of the one being emitted."""
+
+    def test_read_ahead_preserves_order_and_stops(self, fake_api, capsys):
+        """Test that read-ahead emits records in order and stops on a short page."""
+        routes, calls = fake_api
+        workbook_ids = [f"wb{i:03d}" for i in range(250)]
+
+        def list_workbooks(request):
+            params = dict(parse_qsl(urlparse(request.url).query))
+            offset, limit = int(params["offset"]), int(params["limit"])
+            entries = [{"workbookId": wb_id} for wb_id in workbook_ids]
+            return _json_response(request, {"entries": entries[offset : offset + limit]})
+
+        routes["/v2/workbooks"] = list_workbooks
+        tap = TapSigma(config={**SAMPLE_CONFIG, "page_read_ahead": 2})
+        _select_only(tap, "workbooks")
+        tap.sync_all()
+
+        records = _records(capsys)
+        assert [r["record"]["workbookId"] for r in records] == workbook_ids
+        # Three pages plus at most `page_read_ahead` requests past the end
+        assert 3 <= calls.count("/v2/workbooks") <= 5
+
+    def test_no_read_ahead_after_a_short_page(self, fake_api, capsys):
+        """Test that single-page child listings send one request each."""
+        routes, calls = fake_api
+        routes["/v2/workbooks"] = {
+            "entries": [{"workbookId": f"wb{i}"} for i in range(20)]
+        }
+        for i in range(20):
+            routes[f"/v2/workbooks/wb{i}/pages"] = {"entries": [{"pageId": "p1"}]}
+
+        tap = TapSigma(config={**SAMPLE_CONFIG, "page_read_ahead": 2})
+        _select_only(tap, "workbook_pages")
+        tap.sync_all()
+
+        assert sum(path.endswith("/pages") for path in calls) == 20
+
+    @pytest.mark.parametrize("page_read_ahead", [0, 2])
+    def test_paginator_decides_the_last_page(self, fake_api, capsys, page_read_ahead):
+        """Test that pages read ahead end where the SDK's pagination ends."""
+        routes, calls = fake_api
+        routes["/v2/workbooks"] = {
+            "data": [{"workbookId": f"wb{i:03d}"} for i in range(100)]
+        }
+
+        tap = TapSigma(config={**SAMPLE_CONFIG, "page_read_ahead": page_read_ahead})
+        _select_only(tap, "workbooks")
+        tap.sync_all()
+
+        assert len(_records(capsys)) == 100
+        assert calls == ["/v2/workbooks"]
+
+
+class TestHedgedRequests:
+    """Tests for request timeouts and hedging of slow requests."""
+
+    def test_timeouts_can_be_set_per_stream(self):
+        """Test that per-stream timeouts override the tap-wide ones."""
+        tap = TapSigma(
+            config={
+                **SAMPLE_CONFIG,
+                "connect_timeout_seconds": 3,
+                "request_timeouts": [{"stream": "workbooks", "read_seconds": 20}],
+            }
+        )
+        assert tap.streams["workbooks"].timeout == (3, 20)
+        assert tap.streams["datasets"].timeout == (3, 300)
+
+    def test_hedge_budget_holds_under_concurrency(self):
+        """Test that concurrent requests never take more hedges than allowed."""
+        tap = TapSigma(
+            config={
+                **SAMPLE_CONFIG,
+                "max_hedged_requests": 5,
+                "requests_per_minute": 600,
+            }
+        )
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            taken = list(executor.map(lambda _: tap.take_hedge(None), range(200)))
+        assert sum(taken) == 5
+        assert tap._hedges_sent == 5
+
+    def test_slow_request_is_hedged(self, fake_api, capsys):
+        """Test that a request slower than p95 is duplicated and the fast one wins."""
+        routes, calls = fake_api
+        attempts = []
+        released = threading.Event()
+
+        def list_workbooks(request):
+            attempts.append(request)
+            if len(attempts) == 1:
+                # Only answers once the sync is over, unless it is never hedged
+                released.wait(5)
+                return _json_response(request, {"entries": [{"workbookId": "slow"}]})
+            return _json_response(request, {"entries": [{"workbookId": "wb1"}]})
+
+        routes["/v2/workbooks"] = list_workbooks
+        tap = TapSigma(
+            config={**SAMPLE_CONFIG, "hedge_requests": True, "max_hedged_requests": 1}
+        )
+        _select_only(tap, "workbooks")
+        tap.streams["workbooks"]._latencies.extend([0.01] * 20)
+
+        try:
+            tap.sync_all()
+        finally:
+            released.set()
+
+        assert len(attempts) == 2
+        records = _records(capsys)
+        assert [r["record"]["workbookId"] for r in records] == ["wb1"]
+
+
+class TestSyncBudget:
+    """Tests for stopping a run at its request budget and resuming it."""
+
+    def test_stopped_run_resumes_where_it_stopped(self, fake_api, capsys):
+        """Test that a stopped run records completed contexts for the next run."""
+        routes, calls = fake_api
+        routes["/v2/workbooks"] = {
+            "entries": [{"workbookId": f"wb{i}"} for i in range(4)]
+        }
+        for i in range(4):
+            routes[f"/v2/workbooks/wb{i}/pages"] = {"entries": [{"pageId": f"p{i}"}]}
+
+        # One listing request plus two page requests
+        tap = TapSigma(config={**SAMPLE_CONFIG, "max_requests": 3})
+        _select_only(tap, "workbook_pages")
+        tap.sync_all()
+        assert tap.stop_reason == "max_requests"
+        assert sum(path.endswith("/pages") for path in calls) == 2
+
+        calls.clear()
+        tap = TapSigma(config=SAMPLE_CONFIG, state=tap.state)
+        _select_only(tap, "workbook_pages")
+        tap.sync_all()
+        assert tap.stop_reason is None
+        assert [path for path in calls if path.endswith("/pages")] == [
+            "/v2/workbooks/wb2/pages",
+            "/v2/workbooks/wb3/pages",
+        ]
+        assert "completed_contexts" not in tap.state["bookmarks"]["workbook_pages"]
+
+
+class TestSyncServer:
+    """Tests for the long-running sync server."""
+
+    def test_runs_share_resources_and_carry_state(self, fake_api, tmp_path):
+        """Test that runs write separate outputs, reuse the session and keep state."""
+        routes, _ = fake_api
+        routes["/v2/workbooks"] = {"entries": [{"workbookId": "wb1"}]}
+        config_path = tmp_path / "config.json"
+        config_path.write_text(json.dumps(SAMPLE_CONFIG))
+        catalog_path = tmp_path / "catalog.json"
+        tap = TapSigma(config=SAMPLE_CONFIG)
+        _select_only(tap, "workbooks")
+        catalog_path.write_text(json.dumps(tap.catalog_dict))
+        state_path = tmp_path / "state.json"
+
+        server = SyncServer(
+            [str(config_path)],
+            catalog=str(catalog_path),
+            state_path=str(state_path),
+            output=str(tmp_path / "run-{run_id}.jsonl"),
+        )
+        first = server.run_once()
+        session = server._tap.http_session
+        second = server.run_once()
+        assert server._tap.http_session is session
+        server.close()
+
+        assert first["output"] != second["output"]
+        for run in (first, second):
+            messages = [
+                json.loads(line) for line in Path(run["output"]).read_text().splitlines()
+            ]
+            records = [m["record"] for m in messages if m["type"] == "RECORD"]
+            assert [record["workbookId"] for record in records] == ["wb1"]
+        assert json.loads(state_path.read_text()) == server.state
+        assert "workbooks" in server.state["bookmarks"]
+
+
+class TestSampling:
+    """Tests for record caps and parent sampling."""
+
+    def test_record_cap_stops_pagination(self, fake_api, capsys):
+        """Test that no page is requested after the record cap is reached."""
+        routes, calls = fake_api
+        entries = [{"workbookId": f"wb{i:03d}"} for i in range(250)]
+
+        def list_workbooks(request):
+            params = dict(parse_qsl(urlparse(request.url).query))
+            offset, limit = int(params["offset"]), int(params["limit"])
+            return _json_response(request, {"entries": entries[offset : offset + limit]})
+
+        routes["/v2/workbooks"] = list_workbooks
+        tap = TapSigma(config={**SAMPLE_CONFIG, "max_records_per_stream": 100})
+        _select_only(tap, "workbooks")
+        tap.sync_all()
+
+        records = _records(capsys)
+        assert len(records) == 100
+        assert calls.count("/v2/workbooks") == 1
+
+    def test_parent_sample_is_reproducible(self, fake_api, capsys):
+        """Test that the same fraction of parents is sampled on every run."""
+        routes, calls = fake_api
+        routes["/v2/datasets"] = {
+            "entries": [{"datasetId": f"d{i}"} for i in range(60)]
+        }
+        for i in range(60):
+            routes[f"/v2/datasets/d{i}/sources"] = {"entries": []}
+
+        sampled = []
+        for _ in range(2):
+            calls.clear()
+            tap = TapSigma(config={**SAMPLE_CONFIG, "parent_sample_fraction": 0.5})
+            _select_only(tap, "dataset_sources")
+            tap.sync_all()
+            sampled.append([path for path in calls if path.endswith("/sources")])
+
+        assert sampled[0] == sampled[1]
+        assert 15 < len(sampled[0]) < 45
+
+
+class TestParallelStreams:
+    """Tests for syncing top-level stream trees concurrently."""
+
+    def test_independent_streams_sync_concurrently(self, fake_api, capsys):
+        """Test that slow streams overlap and output stays well-formed."""
+        routes, _ = fake_api
+        # Each listing only answers once all three are in flight
+        listings = threading.Barrier(3, timeout=5)
+
+        def listed(payload):
+            def respond(request):
+                listings.wait()
+                return _json_response(request, payload)
+
+            return respond
+
+        routes["/v2/connections"] = listed({"entries": [{"connectionId": "c1"}]})
+        routes["/v2/tags"] = listed({"entries": [{"versionTagId": "t1"}]})
+        routes["/v2/workspaces"] = listed({"entries": [{"workspaceId": "ws1"}]})
+
+        tap = TapSigma(config={**SAMPLE_CONFIG, "parallel_streams": 3})
+        _select_only(tap, "connections", "tags", "workspaces")
+        tap.sync_all()
+        assert not listings.broken
+
+        messages = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        for name in ("connections", "tags", "workspaces"):
+            types = [m["type"] for m in messages if m.get("stream") == name]
+            assert types[0] == "SCHEMA"
+            assert "RECORD" in types
+        final_state = [m for m in messages if m["type"] == "STATE"][-1]["value"]
+        assert {"connections", "tags", "workspaces"} <= set(final_state["bookmarks"])
+
+    def test_state_snapshots_while_streams_update_state(
+        self, fake_api, monkeypatch, capsys
+    ):
+        """Test that STATE lines stay consistent while other streams write state."""
+        routes, _ = fake_api
+        monkeypatch.setattr(SigmaStream, "STATE_MSG_FREQUENCY", 1)
+        routes["/v2/workbooks"] = {
+            "entries": [{"workbookId": f"wb{i}"} for i in range(60)]
+        }
+        for i in range(60):
+            routes[f"/v2/workbooks/wb{i}/schedules"] = {"entries": []}
+        routes["/v2/datasets"] = {
+            "entries": [{"datasetId": f"d{i}"} for i in range(60)]
+        }
+
+        tap = TapSigma(config={**SAMPLE_CONFIG, "parallel_streams": 2})
+        _select_only(tap, "workbook_schedules", "dataset_materializations")
+        tap.sync_all()
+
+        states = [
+            json.loads(line)["value"]
+            for line in capsys.readouterr().out.splitlines()
+            if '"STATE"' in line
+        ]
+        for name in ("workbook_schedules", "dataset_materializations"):
+            assert len(states[-1]["bookmarks"][name]["negative_cache"]) == 60
+
+
+class TestLineageEdges:
+    """Tests for the lineage graph stream."""
+
+    @staticmethod
+    def _sync_lineage(state, capsys, *streams):
+        tap = TapSigma(config=SAMPLE_CONFIG, state=state)
+        _select_only(tap, *(streams or ("dataset_sources",)), "lineage_edges")
+        tap.sync_all()
+        rows = {
+            (r["sourceId"], r["targetId"]): "deleted" if r["isDeleted"] else r["depth"]
+            for r in (m["record"] for m in _records(capsys, "lineage_edges"))
+        }
+        return tap.state, rows
+
+    def test_closure_is_recomputed_for_changed_parents_only(self, fake_api, capsys):
+        """Test direct and transitive edges, and incremental recomputation."""
+        routes, _ = fake_api
+        routes["/v2/datasets"] = {"entries": [{"datasetId": "d1"}, {"datasetId": "d2"}]}
+        routes["/v2/datasets/d1/sources"] = {
+            "entries": [{"sourceId": "t1", "type": "table", "connectionId": "c1"}]
+        }
+        routes["/v2/datasets/d2/sources"] = {
+            "entries": [{"sourceId": "d1", "type": "dataset"}]
+        }
+
+        state, rows = self._sync_lineage({}, capsys)
+        assert rows == {
+            ("c1", "t1"): 1,
+            ("c1", "d1"): 2,
+            ("c1", "d2"): 3,
+            ("t1", "d1"): 1,
+            ("t1", "d2"): 2,
+            ("d1", "d2"): 1,
+        }
+
+        state, rows = self._sync_lineage(state, capsys)
+        assert rows == {}
+
+        routes["/v2/datasets/d2/sources"] = {"entries": []}
+        state, rows = self._sync_lineage(state, capsys)
+        assert rows == {
+            ("c1", "t1"): 1,
+            ("c1", "d1"): 2,
+            ("c1", "d2"): "deleted",
+            ("t1", "d1"): 1,
+            ("t1", "d2"): "deleted",
+            ("d1", "d2"): "deleted",
+        }
+        assert state["bookmarks"]["lineage_edges"]["graph"]["dataset:d2"] == []
+
+    def test_workbooks_are_downstream_of_their_connections(self, fake_api, capsys):
+        """Test that workbooks are linked to the datasets and connections they use."""
+        routes, _ = fake_api
+        routes["/v2/datasets"] = {
+            "entries": [{"datasetId": "d1", "connectionId": "c1"}, {"datasetId": "d2"}]
+        }
+        routes["/v2/datasets/d1/sources"] = {"entries": []}
+        routes["/v2/datasets/d2/sources"] = {
+            "entries": [{"sourceId": "d1", "type": "dataset"}]
+        }
+        routes["/v2/workbooks"] = {"entries": [{"workbookId": "wb1"}]}
+        routes["/v2/workbooks/wb1/sources"] = {
+            "entries": [
+                {"sourceId": "d2", "type": "dataset"},
+                {"sourceId": "t9", "type": "table", "connectionId": "c2"},
+            ]
+        }
+
+        _, rows = self._sync_lineage(
+            {}, capsys, "dataset_sources", "workbook_sources"
+        )
+        assert rows == {
+            ("c1", "d1"): 1,
+            ("c1", "d2"): 2,
+            ("c1", "wb1"): 3,
+            ("d1", "d2"): 1,
+            ("d1", "wb1"): 2,
+            ("d2", "wb1"): 1,
+            ("c2", "t9"): 1,
+            ("c2", "wb1"): 2,
+            ("t9", "wb1"): 1,
+        }
+
+    def test_edges_of_deleted_parents_are_dropped(self, fake_api, capsys):
+        """Test that parents missing from a later listing lose their edges."""
+        routes, _ = fake_api
+        routes["/v2/datasets"] = {
+            "entries": [{"datasetId": "d1", "connectionId": "c1"}, {"datasetId": "d2"}]
+        }
+        routes["/v2/datasets/d1/sources"] = {"entries": []}
+        routes["/v2/datasets/d2/sources"] = {
+            "entries": [{"sourceId": "d1", "type": "dataset"}]
+        }
+        routes["/v2/workbooks"] = {
+            "entries": [{"workbookId": "wb1"}, {"workbookId": "wb2"}]
+        }
+        routes["/v2/workbooks/wb1/sources"] = {
+            "entries": [{"sourceId": "t9", "type": "table", "connectionId": "c2"}]
+        }
+        routes["/v2/workbooks/wb2/sources"] = {
+            "entries": [{"sourceId": "d2", "type": "dataset"}]
+        }
+        streams = ("dataset_sources", "workbook_sources")
+        state, _ = self._sync_lineage({}, capsys, *streams)
+
+        routes["/v2/datasets"] = {
+            "entries": [{"datasetId": "d1", "connectionId": "c1"}]
+        }
+        routes["/v2/workbooks"] = {"entries": [{"workbookId": "wb1"}]}
+        state, rows = self._sync_lineage(state, capsys, *streams)
+        assert rows == {
+            ("c1", "d1"): 1,
+            ("c1", "d2"): "deleted",
+            ("c1", "wb2"): "deleted",
+            ("d1", "d2"): "deleted",
+            ("d1", "wb2"): "deleted",
+            ("d2", "wb2"): "deleted",
+        }
+        graph = state["bookmarks"]["lineage_edges"]["graph"]
+        assert "dataset:d2" not in graph
+        assert "workbook:wb2" not in graph
+        assert "workbook:wb1" in graph